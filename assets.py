@@ -0,0 +1,121 @@
+"""Optimized, content-hashed image and audio assets.
+
+Each source file is turned into a lighter rendition (a resized WebP for images,
+a lower-bitrate MP3 for audio when ffmpeg is available). The rendition is kept
+in memory and written to `static/assets/` under a content-hashed name, so
+Streamlit's static file serving (`server.enableStaticServing`) can hand it to
+the browser by URL instead of the app re-reading and re-sending the bytes.
+Run `python assets.py` at build time to produce every rendition up front.
+"""
+import argparse
+import hashlib
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from PIL import Image
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(APP_DIR, "static", "assets")
+STATIC_URL_PREFIX = "app/static/assets"
+WEBP_QUALITY = 80
+AUDIO_BITRATE = "64k"
+
+
+class Asset(NamedTuple):
+    data: bytes
+    mimetype: str
+    digest: str # Content hash of `data`
+    url: Optional[str] # Static URL, or None if the rendition couldn't be written to static/
+
+
+_cache: Dict[Tuple, Asset] = {}
+_lock = threading.Lock()
+
+
+def image_asset(relative_path: str, width: int) -> Asset:
+    """A WebP rendition of an image, resized for display at `width` CSS pixels."""
+    return _cached(("image", relative_path, width), lambda path: (_render_image(path, width), "image/webp", "webp"))
+
+
+def audio_asset(relative_path: str) -> Asset:
+    """A mono, AUDIO_BITRATE rendition of an audio file (the original if ffmpeg is missing)."""
+    return _cached(("audio", relative_path), lambda path: (_render_audio(path), "audio/mpeg", "mp3"))
+
+
+def _cached(key: Tuple, render) -> Asset:
+    path = os.path.join(APP_DIR, key[1])
+    mtime = os.stat(path).st_mtime # Raises FileNotFoundError for missing sources
+    with _lock:
+        asset = _cache.get(key + (mtime,))
+    if asset is not None:
+        return asset
+    data, mimetype, extension = render(path)
+    digest = hashlib.sha256(data).hexdigest()[:16]
+    stem = os.path.splitext(os.path.basename(path))[0]
+    asset = Asset(data, mimetype, digest, _publish(f"{stem}.{digest}.{extension}", data))
+    with _lock:
+        _cache[key + (mtime,)] = asset
+    return asset
+
+
+def _publish(filename: str, data: bytes) -> Optional[str]:
+    # Hashed names never change content, so an existing file is already current
+    target = os.path.join(STATIC_DIR, filename)
+    try:
+        if not os.path.exists(target):
+            os.makedirs(STATIC_DIR, exist_ok=True)
+            tmp_path = f"{target}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as file:
+                file.write(data)
+            os.replace(tmp_path, target)
+    except OSError:
+        return None
+    return f"{STATIC_URL_PREFIX}/{filename}"
+
+
+def _render_image(path: str, width: int) -> bytes:
+    with Image.open(path) as image:
+        target_width = width * 2 # Sharp on high-DPI screens
+        if image.width > target_width:
+            height = round(image.height * target_width / image.width)
+            image = image.resize((target_width, height), Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, format="WEBP", quality=WEBP_QUALITY, method=6)
+    return buffer.getvalue()
+
+
+def _render_audio(path: str) -> bytes:
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output = os.path.join(tmp_dir, "audio.mp3")
+            result = subprocess.run(
+                [ffmpeg, "-loglevel", "error", "-y", "-i", path, "-ac", "1", "-b:a", AUDIO_BITRATE, output],
+                capture_output=True,
+            )
+            if result.returncode == 0:
+                with open(output, "rb") as file:
+                    return file.read()
+    with open(path, "rb") as file:
+        return file.read()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-render optimized assets into static/assets/.")
+    parser.add_argument("paths", nargs="+", help="Image or audio files, relative to the app directory")
+    parser.add_argument("--image-width", type=int, default=300, help="Display width of images in CSS pixels")
+    args = parser.parse_args()
+    for relative_path in args.paths:
+        is_audio = relative_path.lower().endswith((".mp3", ".wav", ".ogg", ".m4a"))
+        asset = audio_asset(relative_path) if is_audio else image_asset(relative_path, args.image_width)
+        original = os.path.getsize(os.path.join(APP_DIR, relative_path))
+        print(f"{relative_path}: {original / 1024:.0f} KB -> {len(asset.data) / 1024:.0f} KB ({asset.url or 'not published'})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,417 @@
+"""Load test for streamlit_app.py against the local fake Groq API.
+
+Starts `fake_groq_server.py` and `streamlit run streamlit_app.py` as child
+processes, then drives the app with N concurrent websocket sessions that speak
+the same protocol as the browser. Each stage reports rerun latency, render TTFT
+(time until the first streamed token reaches the client), server memory per
+session and server CPU per output token, and the results are written to JSON
+so runs can be compared:
+
+    python benchmark.py --sessions 1 4 16 --output bench.json
+    python benchmark.py --compare baseline.json bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+import uuid
+from typing import Dict, List, Optional
+
+import streamlit
+import websockets
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+import metrics
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+RUN_TIMEOUT = 120 # Seconds one script run may take before the session counts as failed
+STREAM_CURSOR = "▌" # Appended by StreamRenderer while a response is streaming
+PROMPT = "How can I sleep better when I'm anxious?"
+
+# Metrics where a higher value is better; everything else is a cost
+HIGHER_IS_BETTER = {"tokens_per_second", "turns_per_second", "sessions_ok"}
+
+
+class ChildProcess:
+    """A helper process, logging to a file, that is terminated on close."""
+
+    def __init__(self, args: List[str], log_path: str, env: Optional[Dict[str, str]] = None):
+        self.log_path = log_path
+        with open(log_path, "w") as log:
+            self.process = subprocess.Popen(args, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
+
+    def close(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+def start_fake_api(args: argparse.Namespace, work_dir: str) -> ChildProcess:
+    port = _free_port()
+    fake_api = ChildProcess([
+        sys.executable, os.path.join(APP_DIR, "fake_groq_server.py"), "--port", str(port),
+        "--latency", str(args.latency),
+        "--tokens-per-sec", str(args.tokens_per_sec),
+        "--response-tokens", str(args.response_tokens),
+        "--error-rate", str(args.error_rate),
+        "--rate-limit-rate", str(args.rate_limit_rate),
+        "--retry-after", "0.1",
+    ], os.path.join(work_dir, "fake_groq_server.log"))
+    _wait_for_http(f"http://127.0.0.1:{port}/openai/v1/models", fake_api)
+    fake_api.url = f"http://127.0.0.1:{port}"
+    return fake_api
+
+
+def start_app(fake_api_url: str, work_dir: str) -> ChildProcess:
+    port, metrics_port = _free_port(), _free_port()
+    env = dict(
+        os.environ,
+        GROQ_API_KEY="benchmark",
+        GROQ_BASE_URL=fake_api_url,
+        CHAT_STORE_URL=os.path.join(work_dir, "chat_history.sqlite3"),
+        RESPONSE_CACHE_PATH=os.path.join(work_dir, "response_cache.sqlite3"),
+        METRICS_PORT=str(metrics_port),
+    )
+    app = ChildProcess([
+        sys.executable, "-m", "streamlit", "run", os.path.join(APP_DIR, "streamlit_app.py"),
+        "--server.headless", "true",
+        "--server.port", str(port),
+        "--server.fileWatcherType", "none",
+        "--browser.gatherUsageStats", "false",
+    ], os.path.join(work_dir, "streamlit.log"), env)
+    _wait_for_http(f"http://127.0.0.1:{port}/_stcore/health", app)
+    app.url = f"ws://127.0.0.1:{port}/_stcore/stream"
+    app.metrics_url = f"http://127.0.0.1:{metrics_port}/metrics"
+    return app
+
+
+class RunResult:
+    def __init__(self, elapsed: float, first_token: Optional[float], markdown: List[str]):
+        self.elapsed = elapsed
+        self.first_token = first_token # Seconds until a streaming cursor first reached the client
+        self.markdown = markdown # Body of every markdown element the run sent, in order
+
+
+class SessionClient:
+    """One browser tab: a websocket session that reruns the script with widget changes."""
+
+    def __init__(self, url: str, sid: Optional[str] = None):
+        self.url = url
+        self.sid = sid or uuid.uuid4().hex
+        self.widgets: Dict[str, tuple] = {} # Widget key -> (element ID, fragment ID)
+        self.page_script_hash = ""
+        self.ws = None
+
+    async def connect(self):
+        self.ws = await websockets.connect(self.url, subprotocols=["streamlit"], max_size=None)
+
+    async def close(self):
+        if self.ws is not None:
+            await self.ws.close()
+
+    async def rerun(self, *widget_states: WidgetState, fragment_key: Optional[str] = None) -> RunResult:
+        message = BackMsg()
+        message.rerun_script.query_string = f"sid={self.sid}"
+        message.rerun_script.page_script_hash = self.page_script_hash
+        message.rerun_script.widget_states.widgets.extend(widget_states)
+        if fragment_key is not None:
+            message.rerun_script.fragment_id = self.widgets[fragment_key][1]
+        started_at = time.perf_counter()
+        first_token = None
+        markdown = []
+        await self.ws.send(message.SerializeToString())
+        while True:
+            forward = ForwardMsg()
+            forward.ParseFromString(await asyncio.wait_for(self.ws.recv(), RUN_TIMEOUT))
+            kind = forward.WhichOneof("type")
+            if kind == "new_session":
+                self.page_script_hash = forward.new_session.page_script_hash
+            elif kind == "delta" and forward.delta.WhichOneof("type") == "new_element":
+                element = forward.delta.new_element
+                element_type = element.WhichOneof("type")
+                if element_type == "markdown":
+                    markdown.append(element.markdown.body)
+                    if first_token is None and element.markdown.body.endswith(STREAM_CURSOR):
+                        first_token = time.perf_counter() - started_at
+                elif element_type == "exception":
+                    raise RuntimeError(element.exception.message)
+                else:
+                    widget_id = getattr(getattr(element, element_type), "id", "")
+                    if widget_id:
+                        key = "chat_input" if element_type == "chat_input" else widget_id.split("-", 2)[-1]
+                        self.widgets[key] = (widget_id, forward.delta.fragment_id)
+            elif kind == "script_finished" and forward.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                return RunResult(time.perf_counter() - started_at, first_token, markdown)
+
+    def click(self, key: str) -> WidgetState:
+        return WidgetState(id=self.widgets[key][0], trigger_value=True)
+
+    def chat(self, prompt: str) -> WidgetState:
+        state = WidgetState(id=self.widgets["chat_input"][0])
+        state.chat_input_value.data = prompt
+        return state
+
+    def slide(self, key: str, value: float) -> WidgetState:
+        state = WidgetState(id=self.widgets[key][0])
+        state.double_array_value.data.append(value)
+        return state
+
+
+class SessionResult:
+    def __init__(self):
+        self.cold_start: Optional[float] = None
+        self.fragment_reruns: List[float] = []
+        self.full_reruns: List[float] = []
+        self.turns: List[float] = []
+        self.ttfts: List[float] = []
+        self.error: Optional[str] = None
+
+
+async def run_session(client: SessionClient, index: int, args: argparse.Namespace,
+                      start: asyncio.Event, result: SessionResult):
+    """One simulated user: open the app, dismiss the welcome, chat, and tweak settings."""
+    try:
+        await start.wait()
+        run = await client.rerun()
+        result.cold_start = run.elapsed
+        await client.rerun(client.click("dismiss_welcome"))
+        for turn in range(args.turns):
+            # Unique prompts, so the first turn never comes from the response cache
+            run = await client.rerun(client.chat(f"{PROMPT} (session {index}, turn {turn}, {uuid.uuid4().hex[:8]})"))
+            result.turns.append(run.elapsed)
+            if run.first_token is not None:
+                result.ttfts.append(run.first_token)
+            for rerun in range(args.reruns):
+                # A sidebar slider reruns just its fragment; a full rerun redraws the chat too
+                slider = client.slide("temp_slider", 0.5 + 0.1 * ((rerun + turn) % 2))
+                result.fragment_reruns.append((await client.rerun(slider, fragment_key="temp_slider")).elapsed)
+                result.full_reruns.append((await client.rerun()).elapsed)
+    except Exception as e:
+        result.error = f"{type(e).__name__}: {e}"
+
+
+async def run_stage(app: ChildProcess, sessions: int, args: argparse.Namespace) -> Dict:
+    clients = [SessionClient(app.url) for _ in range(sessions)]
+    results = [SessionResult() for _ in range(sessions)]
+    tokens_before = _scrape_counter(app.metrics_url, "groq_output_tokens_total")
+    rss_before = _rss_bytes(app.pid)
+    try:
+        await asyncio.gather(*(client.connect() for client in clients))
+        start = asyncio.Event()
+        tasks = [asyncio.create_task(run_session(clients[i], i, args, start, results[i])) for i in range(sessions)]
+        cpu_started_at = _cpu_seconds(app.pid)
+        wall_started_at = time.perf_counter()
+        start.set()
+        await asyncio.gather(*tasks)
+        wall_time = time.perf_counter() - wall_started_at
+        cpu_time = _cpu_seconds(app.pid) - cpu_started_at if cpu_started_at is not None else None
+        # Measured while every session is still connected; RSS is noisy, so trust larger stages more
+        rss_after = _rss_bytes(app.pid)
+    finally:
+        await asyncio.gather(*(client.close() for client in clients))
+
+    ok = [r for r in results if r.error is None]
+    tokens_after = _scrape_counter(app.metrics_url, "groq_output_tokens_total")
+    tokens = tokens_after - (tokens_before or 0) if tokens_after is not None else None
+    turns = sum(len(r.turns) for r in ok)
+    return {
+        "sessions": sessions,
+        "sessions_ok": len(ok),
+        "sessions_failed": len(results) - len(ok),
+        "errors": sorted({r.error for r in results if r.error}),
+        "cold_start_ms": _summary([r.cold_start for r in ok if r.cold_start is not None]),
+        "fragment_rerun_ms": _summary([t for r in ok for t in r.fragment_reruns]),
+        "full_rerun_ms": _summary([t for r in ok for t in r.full_reruns]),
+        "turn_ms": _summary([t for r in ok for t in r.turns]),
+        "ttft_ms": _summary([t for r in ok for t in r.ttfts]),
+        "memory_per_session_kb": (
+            round((rss_after - rss_before) / 1024 / sessions, 1)
+            if rss_before is not None and rss_after is not None else None
+        ),
+        "cpu_ms_per_token": round(cpu_time * 1000 / tokens, 4) if cpu_time is not None and tokens else None,
+        "tokens": int(tokens) if tokens is not None else None,
+        "tokens_per_second": round(tokens / wall_time, 1) if tokens is not None else None,
+        "turns_per_second": round(turns / wall_time, 2),
+        "wall_time_s": round(wall_time, 2),
+    }
+
+
+async def run_benchmark(args: argparse.Namespace) -> Dict:
+    work_dir = tempfile.mkdtemp(prefix="mnemosyne-bench-")
+    fake_api = start_fake_api(args, work_dir)
+    try:
+        app = start_app(fake_api.url, work_dir)
+        try:
+            # A warm-up session pays for imports and cached resources outside the measurement
+            warm_up = await run_stage(app, 1, argparse.Namespace(turns=1, reruns=1))
+            if warm_up["sessions_failed"]:
+                raise RuntimeError(f"Warm-up session failed: {warm_up['errors']}")
+            stages = [await run_stage(app, sessions, args) for sessions in args.sessions]
+        finally:
+            app.close()
+    finally:
+        fake_api.close()
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "environment": {
+            "python": platform.python_version(),
+            "streamlit": streamlit.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "stages": stages,
+    }
+
+
+def compare(baseline_path: str, current_path: str, max_regression: float) -> int:
+    """Prints metric changes between two result files; non-zero exit if any regressed too far."""
+    with open(baseline_path, encoding="utf-8") as file:
+        baseline = _flatten(json.load(file))
+    with open(current_path, encoding="utf-8") as file:
+        current = _flatten(json.load(file))
+    regressions = []
+    for name in sorted(set(baseline) & set(current)):
+        before, after = baseline[name], current[name]
+        if not before:
+            continue
+        change = (after - before) / before
+        worse = -change if name.split(".")[1] in HIGHER_IS_BETTER else change
+        flag = ""
+        if worse > max_regression:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:40} {before:>12.4g} -> {after:>12.4g}  {change:+7.1%}{flag}")
+    return 1 if regressions else 0
+
+
+def _flatten(report: Dict) -> Dict[str, float]:
+    # "<sessions>.<metric>[.<stat>]" -> value, for every numeric result
+    flat = {}
+    for stage in report["stages"]:
+        prefix = str(stage["sessions"])
+        for name, value in stage.items():
+            if isinstance(value, dict):
+                flat.update({f"{prefix}.{name}.{k}": v for k, v in value.items() if k != "count" and v is not None})
+            elif isinstance(value, (int, float)) and name != "sessions":
+                flat[f"{prefix}.{name}"] = value
+    return flat
+
+
+def _summary(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"count": 0, "mean": None, "p50": None, "p95": None, "p99": None}
+    p50, p95, p99 = metrics.quantiles(values, (0.5, 0.95, 0.99))
+    return {
+        "count": len(values),
+        "mean": round(statistics.fmean(values) * 1000, 2),
+        "p50": round(p50 * 1000, 2),
+        "p95": round(p95 * 1000, 2),
+        "p99": round(p99 * 1000, 2),
+    }
+
+
+def _scrape_counter(url: str, name: str) -> Optional[float]:
+    """Sum of an OpenMetrics counter across all label sets; None before the exporter is up."""
+    try:
+        with urllib.request.urlopen(url, timeout=10) as response:
+            text = response.read().decode("utf-8")
+    except OSError:
+        return None
+    return sum(float(value) for value in re.findall(rf"^{name}(?:{{[^}}]*}})? (\S+)$", text, re.MULTILINE))
+
+
+def _rss_bytes(pid: int) -> Optional[int]:
+    # Linux only; None elsewhere
+    try:
+        with open(f"/proc/{pid}/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return None
+
+
+def _cpu_seconds(pid: int) -> Optional[float]:
+    # utime + stime of the app process (Linux only)
+    try:
+        with open(f"/proc/{pid}/stat") as file:
+            fields = file.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except OSError:
+        return None
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_http(url: str, process: ChildProcess, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.process.poll() is not None:
+            with open(process.log_path) as log:
+                raise RuntimeError(f"Process for {url} exited:\n{log.read()}")
+        try:
+            with urllib.request.urlopen(url, timeout=2):
+                return
+        except OSError:
+            time.sleep(0.2)
+    process.close()
+    raise RuntimeError(f"Timed out waiting for {url}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 4, 16],
+                        help="Concurrent sessions per stage; one stage is run for each value")
+    parser.add_argument("--turns", type=int, default=3, help="Chat turns per session")
+    parser.add_argument("--reruns", type=int, default=3, help="Settings changes and full reruns after each turn")
+    parser.add_argument("--latency", type=float, default=0.2, help="Fake API seconds before the first byte")
+    parser.add_argument("--tokens-per-sec", type=float, default=200.0)
+    parser.add_argument("--response-tokens", type=int, default=120)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--output", default="benchmark.json", help="Where to write the JSON results")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="Compare two result files")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="With --compare, fail if a metric got worse by more than this fraction")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(compare(*args.compare, args.max_regression))
+
+    report = asyncio.run(run_benchmark(args))
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    for stage in report["stages"]:
+        print(
+            f"{stage['sessions']:>4} sessions: rerun p95 {stage['full_rerun_ms']['p95']} ms, "
+            f"fragment p95 {stage['fragment_rerun_ms']['p95']} ms, TTFT p95 {stage['ttft_ms']['p95']} ms, "
+            f"{stage['memory_per_session_kb']} KB/session, {stage['cpu_ms_per_token']} CPU ms/token, "
+            f"{stage['sessions_failed']} failed"
+        )
+    print(f"Results written to {args.output}")
+    if any(stage["sessions_failed"] for stage in report["stages"]):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""Persistent storage for chat transcripts, mood logs and per-session settings.
+
+`ChatStore` is the interface the app talks to; `SQLiteChatStore` is the default
+backend. Messages are appended one row at a time and read back in pages, so a
+session never has to hold or re-read its full transcript. Because everything a
+session needs lives here, any app worker pointed at the same store can serve it.
+Every change to a session's messages or moods bumps its revision, so a worker
+can tell with one lookup whether its copy of the session is stale.
+"""
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+class ChatStore(ABC):
+    """Interface for chat/mood storage backends."""
+
+    @abstractmethod
+    def append_message(self, session_id: str, role: str, content: str) -> Tuple[int, int]:
+        """Stores one message; returns its 1-based position in the session and the session's new revision."""
+
+    @abstractmethod
+    def load_messages(self, session_id: str, limit: int, before_seq: Optional[int] = None) -> List[Dict]:
+        """Returns up to `limit` messages before position `before_seq` (newest page by default), oldest first."""
+
+    @abstractmethod
+    def count_messages(self, session_id: str) -> int:
+        """Returns how many messages the session has stored (the position of the newest one)."""
+
+    @abstractmethod
+    def append_mood(self, session_id: str, entry: Dict[str, str]) -> int:
+        """Stores one mood entry and returns the session's new revision."""
+
+    @abstractmethod
+    def load_moods(self, session_id: str, limit: Optional[int] = None) -> List[Dict[str, str]]:
+        """Returns the most recent `limit` mood entries (all by default), oldest first."""
+
+    @abstractmethod
+    def load_settings(self, session_id: str) -> Dict[str, Any]:
+        """Returns the session's saved UI settings (theme, model, ...) by name."""
+
+    @abstractmethod
+    def save_setting(self, session_id: str, name: str, value: Any):
+        """Stores one JSON-serializable setting, replacing any previous value."""
+
+    @abstractmethod
+    def clear_session(self, session_id: str, moods: bool = True) -> int:
+        """Deletes the session's messages (and moods), keeping settings; returns the session's new revision."""
+
+    @abstractmethod
+    def revision(self, session_id: str) -> int:
+        """Counts the changes to the session's messages and moods (0 for a new session)."""
+
+
+class SQLiteChatStore(ChatStore):
+    """SQLite backend in WAL mode, so page reads don't block appends."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY,
+                session_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE UNIQUE INDEX IF NOT EXISTS messages_session_seq ON messages (session_id, seq);
+            CREATE INDEX IF NOT EXISTS messages_created_at ON messages (created_at);
+            CREATE TABLE IF NOT EXISTS moods (
+                id INTEGER PRIMARY KEY,
+                session_id TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                date TEXT NOT NULL,
+                mood TEXT NOT NULL,
+                notes TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS moods_session_created_at ON moods (session_id, created_at);
+            CREATE TABLE IF NOT EXISTS settings (
+                session_id TEXT NOT NULL,
+                name TEXT NOT NULL,
+                value TEXT NOT NULL,
+                PRIMARY KEY (session_id, name)
+            );
+            CREATE TABLE IF NOT EXISTS revisions (
+                session_id TEXT PRIMARY KEY,
+                revision INTEGER NOT NULL
+            );
+            """
+        )
+
+    def append_message(self, session_id: str, role: str, content: str) -> Tuple[int, int]:
+        def insert() -> int:
+            seq = self._db.execute(
+                "SELECT COALESCE(MAX(seq), 0) + 1 FROM messages WHERE session_id = ?", (session_id,)
+            ).fetchone()[0]
+            self._db.execute(
+                "INSERT INTO messages (session_id, seq, role, content, created_at) VALUES (?, ?, ?, ?, ?)",
+                (session_id, seq, role, content, time.time()),
+            )
+            return seq
+
+        return self._change(session_id, insert)
+
+    def load_messages(self, session_id: str, limit: int, before_seq: Optional[int] = None) -> List[Dict]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT seq, role, content, created_at FROM messages"
+                " WHERE session_id = ? AND seq < ? ORDER BY seq DESC LIMIT ?",
+                (session_id, before_seq if before_seq is not None else 2 ** 62, limit),
+            ).fetchall()
+        return [
+            {"seq": seq, "role": role, "content": content, "created_at": created_at}
+            for seq, role, content, created_at in reversed(rows)
+        ]
+
+    def count_messages(self, session_id: str) -> int:
+        with self._lock:
+            return self._db.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM messages WHERE session_id = ?", (session_id,)
+            ).fetchone()[0]
+
+    def append_mood(self, session_id: str, entry: Dict[str, str]) -> int:
+        return self._change(session_id, lambda: self._db.execute(
+            "INSERT INTO moods (session_id, created_at, date, mood, notes) VALUES (?, ?, ?, ?, ?)",
+            (session_id, time.time(), entry["date"], entry["mood"], entry["notes"]),
+        ))[1]
+
+    def load_moods(self, session_id: str, limit: Optional[int] = None) -> List[Dict[str, str]]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT date, mood, notes FROM moods WHERE session_id = ? ORDER BY created_at DESC LIMIT ?",
+                (session_id, -1 if limit is None else limit),
+            ).fetchall()
+        return [{"date": date, "mood": mood, "notes": notes} for date, mood, notes in reversed(rows)]
+
+    def load_settings(self, session_id: str) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._db.execute("SELECT name, value FROM settings WHERE session_id = ?", (session_id,)).fetchall()
+        return {name: json.loads(value) for name, value in rows}
+
+    def save_setting(self, session_id: str, name: str, value: Any):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO settings (session_id, name, value) VALUES (?, ?, ?)",
+                (session_id, name, json.dumps(value)),
+            )
+
+    def clear_session(self, session_id: str, moods: bool = True) -> int:
+        def delete():
+            self._db.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            if moods:
+                self._db.execute("DELETE FROM moods WHERE session_id = ?", (session_id,))
+
+        return self._change(session_id, delete)[1]
+
+    def revision(self, session_id: str) -> int:
+        with self._lock:
+            row = self._db.execute("SELECT revision FROM revisions WHERE session_id = ?", (session_id,)).fetchone()
+        return row[0] if row else 0
+
+    def _change(self, session_id: str, write: Callable[[], Any]) -> Tuple[Any, int]:
+        """Runs `write` and bumps the session's revision in one transaction; returns (its result, new revision)."""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                result = write()
+                self._db.execute(
+                    "INSERT INTO revisions (session_id, revision) VALUES (?, 1)"
+                    " ON CONFLICT (session_id) DO UPDATE SET revision = revision + 1",
+                    (session_id,),
+                )
+                revision = self._db.execute(
+                    "SELECT revision FROM revisions WHERE session_id = ?", (session_id,)
+                ).fetchone()[0]
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return result, revision
+
+
+def create_chat_store(url: str) -> ChatStore:
+    """Builds a store from a URL such as `sqlite:///chat_history.sqlite3` or a plain file path."""
+    if url.startswith("sqlite:///"):
+        return SQLiteChatStore(url[len("sqlite:///"):])
+    if "://" in url:
+        raise ValueError(f"Unsupported chat store URL: {url}")
+    return SQLiteChatStore(url)
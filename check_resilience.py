@@ -0,0 +1,198 @@
+"""End-to-end check of the retry, circuit-breaker and fallback layer.
+
+Starts the fake Groq API in-process and streams through `ResilientChat` with
+one kind of failure injected at a time, checking that:
+
+- a 429 is retried after its Retry-After, and only once the server allows it;
+- a 503 is retried with a short backoff, and Groq's informational
+  x-ratelimit-reset-* headers don't take the model offline;
+- a stream cut off half way is resumed without repeating or losing text,
+  including markdown whose line breaks and double spaces must survive;
+- the part of max_tokens a short reply didn't use goes back to the
+  rate limits, so admission isn't throttled by replies never written;
+- a stream stopped while queued for admission (an abandoned draft)
+  leaves the line promptly without sending a request;
+- a removed model (404) opens its circuit and the next model answers;
+- once the cooldown is over, a single trial request goes to the model and
+  a success closes the circuit again.
+
+    python check_resilience.py
+"""
+import argparse
+import sys
+import threading
+import time
+from typing import List
+
+from groq import Groq
+
+import fake_groq_server
+from rate_limiter import AdmissionController, RateLimits
+from resilient_chat import ModelsUnavailableError, ResilientChat
+
+MODEL = "llama-3.3-70b-versatile"
+FALLBACK_MODEL = "Llama3-8b-8192"
+# Shorter than the answer, so it repeats; newlines and a hard line break sit inside the server's tokens
+MARKDOWN = "## Sleep\n\n- keep a **regular** schedule\n- no screens  \nafter ten\n\n```\nbreathe in for 4\n```"
+REQUEST = {"messages": [{"role": "user", "content": "How can I sleep better?"}], "max_tokens": 40}
+
+
+class CheckFailed(Exception):
+    pass
+
+
+def _expect(condition: bool, message: str):
+    if not condition:
+        raise CheckFailed(message)
+
+
+class Harness:
+    """The fake API and a ResilientChat in front of it; `sleep` records every backoff."""
+
+    def __init__(self, args: argparse.Namespace):
+        self.config = fake_groq_server.FakeGroqConfig(latency=0.01, tokens_per_sec=0, response_tokens=40, seed=1)
+        self.server = fake_groq_server.serve(self.config)
+        self.client = client = Groq(api_key="check", base_url=f"http://127.0.0.1:{self.server.server_address[1]}",
+                                    max_retries=0)
+        self.delays: List[float] = []
+        self.on_sleep = lambda: None # Runs before each backoff, e.g. to end an injected failure
+        self.chat = ResilientChat(client, max_retries=args.max_retries, base_delay=0.05, max_delay=args.max_delay,
+                                  breaker_threshold=3, breaker_cooldown=args.cooldown, sleep=self.sleep)
+
+    def sleep(self, seconds: float):
+        self.delays.append(seconds)
+        self.on_sleep()
+        time.sleep(seconds)
+
+    def stream(self, candidates: List[str]):
+        response_stream = self.chat.stream(candidates, lambda model: REQUEST)
+        try:
+            return response_stream, "".join(response_stream)
+        except ModelsUnavailableError as e:
+            raise CheckFailed(f"the stream gave up: {e}")
+
+    def reset(self):
+        self.config.rate_limit_rate = self.config.error_rate = self.config.drop_rate = 0.0
+        self.config.unavailable_models = set()
+        self.config.text = fake_groq_server.LOREM
+        self.delays.clear()
+        self.on_sleep = lambda: None
+
+
+def check_rate_limit(h: Harness, expected: str):
+    h.config.rate_limit_rate = 1.0
+    h.config.retry_after = 0.3
+    h.on_sleep = lambda: setattr(h.config, "rate_limit_rate", 0.0)
+    response_stream, text = h.stream([MODEL])
+    _expect(text == expected, "429: the retried answer differs from a clean one")
+    _expect(response_stream.retries == 1 and response_stream.model == MODEL, "429: expected one retry on the same model")
+    _expect(h.delays[0] >= 0.3, f"429: waited {h.delays[0]:.2f}s, less than Retry-After")
+
+
+def check_server_error(h: Harness, expected: str, max_delay: float):
+    h.config.error_rate = 1.0
+    h.on_sleep = lambda: setattr(h.config, "error_rate", 0.0)
+    response_stream, text = h.stream([MODEL])
+    _expect(text == expected and response_stream.retries == 1, "503: expected one retry and a full answer")
+    _expect(h.delays[0] <= max_delay, f"503: backed off {h.delays[0]:.1f}s because of x-ratelimit-reset-* headers")
+    _expect(h.chat.breaker(MODEL).state == "closed", "503: one transient error opened the circuit")
+
+
+def check_dropped_stream(h: Harness, expected: str):
+    h.config.drop_rate = 1.0
+    h.on_sleep = lambda: setattr(h.config, "drop_rate", 0.0)
+    response_stream, text = h.stream([MODEL])
+    _expect(response_stream.resumed == 1, f"drop: expected one resumed stream, got {response_stream.resumed}")
+    _expect(text == expected, f"drop: resumed text differs from a clean answer:\n{text!r}\n{expected!r}")
+
+
+def check_dropped_markdown(h: Harness):
+    h.config.text = MARKDOWN
+    _, expected = h.stream([MODEL])
+    check_dropped_stream(h, expected)
+
+
+def check_refund(h: Harness):
+    # Ten requests reserving max_tokens=2048 each would take 20k of a 15k tokens/min budget
+    admission = AdmissionController({MODEL: RateLimits(1000, 15000)}, ["check"], max_wait=1.0)
+    chat = ResilientChat(h.client, admission=admission, clients={"check": h.client})
+    for i in range(10):
+        response_stream = chat.stream([MODEL], lambda model: {**REQUEST, "max_tokens": 2048})
+        try:
+            "".join(response_stream)
+        except ModelsUnavailableError as e:
+            raise CheckFailed(f"refund: request {i + 1} of 10 wasn't admitted: {e}")
+
+
+def check_stopped_in_queue(h: Harness):
+    # Two requests a minute: the first one spends the budget, the second has to queue
+    admission = AdmissionController({MODEL: RateLimits(2, 100000)}, ["check"], max_wait=10.0,
+                                    cancel_poll_interval=0.05)
+    chat = ResilientChat(h.client, admission=admission, clients={"check": h.client})
+    for _ in range(2):
+        "".join(chat.stream([MODEL], lambda model: REQUEST))
+    stop = threading.Event()
+    threading.Timer(0.2, stop.set).start()
+    sent, started_at = h.config.requests, time.monotonic()
+    text = "".join(chat.stream([MODEL], lambda model: REQUEST, stop=stop))
+    elapsed = time.monotonic() - started_at
+    _expect(text == "" and h.config.requests == sent, "stop: a stopped stream still sent its request")
+    _expect(elapsed < 1.0, f"stop: the stopped stream stayed in line for {elapsed:.1f}s")
+    _expect(admission.queue_length(MODEL) == 0, "stop: the stopped stream is still queued")
+
+
+def check_fallback(h: Harness, expected: str):
+    h.config.unavailable_models = {MODEL}
+    response_stream, text = h.stream([MODEL, FALLBACK_MODEL])
+    _expect(response_stream.model == FALLBACK_MODEL and text == expected, "404: the fallback model didn't answer")
+    _expect(h.chat.breaker(MODEL).state == "open", "404: the removed model's circuit isn't open")
+    _expect(not h.chat.is_healthy(MODEL), "404: the removed model still counts as healthy")
+
+
+def check_half_open(h: Harness, expected: str, cooldown: float):
+    breaker = h.chat.breaker(MODEL) # Opened by check_fallback
+    time.sleep(cooldown)
+    allowed = []
+    threads = [threading.Thread(target=lambda: allowed.append(breaker.allow())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    _expect(allowed.count(True) == 1, f"half-open: {allowed.count(True)} of 8 callers were let through, not 1")
+    breaker.probe_started_at = None # Hand the trial to the stream below
+    response_stream, text = h.stream([MODEL, FALLBACK_MODEL])
+    _expect(response_stream.model == MODEL and text == expected, "half-open: the recovered model didn't answer")
+    _expect(breaker.state == "closed", "half-open: a successful trial didn't close the circuit")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--max-retries", type=int, default=3)
+    parser.add_argument("--max-delay", type=float, default=2.0)
+    parser.add_argument("--cooldown", type=float, default=0.5)
+    args = parser.parse_args()
+    h = Harness(args)
+    try:
+        _, expected = h.stream([MODEL])
+        for name, check in [
+            ("429 with Retry-After", lambda: check_rate_limit(h, expected)),
+            ("503 with reset headers", lambda: check_server_error(h, expected, args.max_delay)),
+            ("dropped stream", lambda: check_dropped_stream(h, expected)),
+            ("dropped markdown stream", lambda: check_dropped_markdown(h)),
+            ("unused max_tokens refunded", lambda: check_refund(h)),
+            ("stopped while queued", lambda: check_stopped_in_queue(h)),
+            ("404 fallback", lambda: check_fallback(h, expected)),
+            ("half-open trial", lambda: check_half_open(h, expected, args.cooldown)),
+        ]:
+            check()
+            print(f"OK: {name}")
+            h.reset()
+    except CheckFailed as e:
+        print(f"FAILED: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        h.server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""End-to-end check that a conversation can move between app workers.
+
+Starts the fake Groq API, N workers sharing one set of state files, and the
+round-robin proxy from launch_workers.py. It then chats in a single session,
+opening a fresh connection for every turn so each one lands on another worker,
+and checks that:
+
+- every worker renders the full stored history and the session's settings;
+- each request sent to the API carries the previous turn, wherever it was made;
+- a connection left open on one worker catches up with turns made elsewhere;
+- the workers spend from one shared set of rate-limit buckets.
+
+    python check_workers.py --workers 3 --turns 6
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import urllib.request
+import uuid
+from typing import Dict, List
+
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+import fake_groq_server
+from benchmark import PROMPT, SessionClient, _free_port
+from chat_store import create_chat_store
+from launch_workers import Worker, shared_env, start_proxy, start_workers
+
+DARK_TITLE_COLOR = "#BA55D3" # The page title link uses this color in the dark theme
+
+
+class CheckFailed(Exception):
+    pass
+
+
+def _expect(condition: bool, message: str):
+    if not condition:
+        raise CheckFailed(message)
+
+
+def _unrendered(stored: List[Dict], markdown: List[str]) -> List[int]:
+    """Positions of stored messages missing from a run's markdown (Streamlit strips the bodies)."""
+    rendered = {body.strip() for body in markdown}
+    return [m["seq"] for m in stored if m["content"].strip() not in rendered]
+
+
+def _wait_until_healthy(workers: List[Worker], timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    for worker in workers:
+        while True:
+            _expect(worker.alive, f"worker {worker.index} exited; see {worker.log_path}")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{worker.port}/_stcore/health", timeout=2):
+                    break
+            except OSError:
+                _expect(time.monotonic() < deadline, f"worker {worker.index} didn't start; see {worker.log_path}")
+                time.sleep(0.2)
+
+
+async def check(args: argparse.Namespace):
+    work_dir = tempfile.mkdtemp(prefix="mnemosyne-workers-")
+    config = fake_groq_server.FakeGroqConfig(latency=0.05, tokens_per_sec=400, response_tokens=30)
+    api = fake_groq_server.serve(config)
+    chat_store_path = os.path.join(work_dir, "chat_history.sqlite3")
+    rate_limit_path = os.path.join(work_dir, "rate_limits.sqlite3")
+    env = shared_env(dict(
+        os.environ,
+        GROQ_API_KEY="check",
+        GROQ_BASE_URL=f"http://127.0.0.1:{api.server_address[1]}",
+        CHAT_STORE_URL=chat_store_path,
+        RESPONSE_CACHE_PATH=os.path.join(work_dir, "response_cache.sqlite3"),
+        RATE_LIMIT_STORE_URL="sqlite:///" + rate_limit_path,
+    ))
+    env.pop("METRICS_PORT", None)
+    workers = start_workers([_free_port() for _ in range(args.workers)], env, log_dir=work_dir)
+    clients: List[SessionClient] = []
+    try:
+        _wait_until_healthy(workers)
+        proxy_port = _free_port()
+        proxy = await start_proxy(workers, proxy_port)
+        url = f"ws://127.0.0.1:{proxy_port}/_stcore/stream"
+        sid = uuid.uuid4().hex
+        store = create_chat_store(chat_store_path)
+        previous_prompt = None
+        for turn in range(args.turns):
+            client = SessionClient(url, sid)
+            await client.connect()
+            clients.append(client)
+            run = await client.rerun()
+            missing = _unrendered(store.load_messages(sid, limit=1000), run.markdown)
+            _expect(not missing, f"turn {turn}: stored messages {missing} weren't rendered")
+            _expect(("dismiss_welcome" in client.widgets) == (turn == 0),
+                    f"turn {turn}: the welcome screen should only show before the first turn")
+            _expect(any(DARK_TITLE_COLOR in body for body in run.markdown) == (turn > 1),
+                    f"turn {turn}: the theme chosen on turn 1 wasn't applied")
+            if turn == 0:
+                await client.rerun(client.click("dismiss_welcome"))
+            elif turn == 1:
+                await client.rerun(WidgetState(id=client.widgets["theme_radio"][0], string_value="🌙 Dark"))
+
+            requests_before = len(config.received)
+            prompt = f"{PROMPT} (turn {turn}, {uuid.uuid4().hex[:8]})"
+            await client.rerun(client.chat(prompt))
+            _expect(len(config.received) > requests_before, f"turn {turn}: no request reached the API")
+            sent = [m["content"] for m in config.received[-1]]
+            _expect(prompt in sent, f"turn {turn}: the request didn't carry the new prompt")
+            _expect(previous_prompt is None or previous_prompt in sent,
+                    f"turn {turn}: the request didn't carry the previous turn")
+            _expect(store.count_messages(sid) == 2 * (turn + 1), f"turn {turn}: reply wasn't stored")
+            previous_prompt = prompt
+            if turn > 0:
+                await client.close() # The first connection stays open to go stale
+
+        # The first connection's worker hasn't seen the later turns yet
+        run = await clients[0].rerun()
+        missing = _unrendered(store.load_messages(sid, limit=1000), run.markdown)
+        _expect(not missing, f"stale connection: stored messages {missing} weren't rendered")
+        _expect(any(DARK_TITLE_COLOR in body for body in run.markdown), "stale connection: theme not synced")
+
+        served = [worker.connections for worker in workers]
+        _expect(all(served) or args.turns < args.workers, f"turns weren't spread over every worker: {served}")
+        with sqlite3.connect(rate_limit_path) as db:
+            buckets = db.execute("SELECT COUNT(*) FROM buckets").fetchone()[0]
+        _expect(buckets > 0, "no rate-limit bucket was written to the shared store")
+        print(f"OK: {args.turns} turns over {args.workers} workers (connections per worker: {served}), "
+              f"{buckets} shared rate-limit buckets")
+        proxy.close()
+    finally:
+        for client in clients:
+            await client.close()
+        for worker in workers:
+            worker.stop()
+        api.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--turns", type=int, default=6)
+    args = parser.parse_args()
+    try:
+        asyncio.run(check(args))
+    except CheckFailed as e:
+        print(f"FAILED: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""Local stand-in for the Groq chat-completions API.
+
+Speaks the same `/openai/v1/chat/completions` protocol (JSON and SSE streaming)
+with configurable latency, token rate and error injection, so the app and its
+retry/fallback layer can be exercised without a real API key:
+
+    python fake_groq_server.py --port 8787 --rate-limit-rate 0.2 --drop-rate 0.1
+    GROQ_BASE_URL=http://127.0.0.1:8787 GROQ_API_KEY=fake streamlit run streamlit_app.py
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+# Informational headers Groq sends with every response; reset-requests is when the daily budget refills
+RATE_LIMIT_HEADERS = {"x-ratelimit-reset-requests": "2m59.56s", "x-ratelimit-reset-tokens": "7.66s"}
+LOREM = (
+    "Noticing early signs is a strength, not a weakness. Try to keep a regular sleep schedule, "
+    "move your body a little every day, and write down what you feel and when. "
+    "If these feelings persist for more than two weeks, consider talking to a professional. "
+)
+
+
+class FakeGroqConfig:
+    def __init__(self, latency: float = 0.05, tokens_per_sec: float = 200.0, response_tokens: int = 60,
+                 error_rate: float = 0.0, rate_limit_rate: float = 0.0, retry_after: float = 1.0,
+                 drop_rate: float = 0.0, unavailable_models=(), seed: Optional[int] = None, model_latency=None,
+                 text: str = LOREM):
+        self.latency = latency # Seconds before the first byte
+        self.model_latency = dict(model_latency or {}) # Per-model overrides of `latency`
+        self.tokens_per_sec = tokens_per_sec
+        self.response_tokens = response_tokens
+        self.text = text # Answers repeat this, one space-separated word per token
+        self.error_rate = error_rate # Share of requests answered with a 503
+        self.rate_limit_rate = rate_limit_rate # Share of requests answered with a 429
+        self.retry_after = retry_after
+        self.drop_rate = drop_rate # Share of streams cut off half way through
+        self.unavailable_models = set(unavailable_models) # Answered with a 404 like decommissioned models
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.received = [] # Messages of every chat request, for checks on what the app sent
+
+    def roll(self, rate: float) -> bool:
+        with self.lock:
+            return self.random.random() < rate
+
+
+class FakeGroqHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Chunked streaming, so a dropped stream is a visible error
+    config: FakeGroqConfig = FakeGroqConfig()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/openai/v1/models":
+            return self._send_json(200, {"object": "list", "data": []})
+        self._send_error(404, "not_found", "Unknown route")
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/openai/v1/chat/completions":
+            return self._send_error(404, "not_found", "Unknown route")
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        config = self.config
+        with config.lock:
+            config.requests += 1
+            config.received.append(body.get("messages") or [])
+        model = body.get("model", "")
+        time.sleep(config.model_latency.get(model, config.latency))
+        if model in config.unavailable_models:
+            return self._send_error(404, "model_not_found", f"The model `{model}` does not exist")
+        if config.roll(config.rate_limit_rate):
+            return self._send_error(429, "rate_limit_exceeded", "Rate limit reached",
+                                    {"retry-after": f"{config.retry_after:g}", **RATE_LIMIT_HEADERS})
+        if config.roll(config.error_rate):
+            return self._send_error(503, "service_unavailable", "Service unavailable", RATE_LIMIT_HEADERS)
+
+        tokens = _response_tokens(body, config.response_tokens, config.text)
+        if body.get("stream"):
+            self._stream(model, tokens, drop=config.roll(config.drop_rate))
+        else:
+            self._send_json(200, _completion(model, "".join(tokens), len(tokens)))
+
+    def _stream(self, model: str, tokens: list, drop: bool):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        delay = 1.0 / self.config.tokens_per_sec if self.config.tokens_per_sec > 0 else 0.0
+        cut_at = len(tokens) // 2 if drop else None
+        for i, token in enumerate(tokens):
+            if i == cut_at:
+                self.close_connection = True
+                self.wfile.flush()
+                return # No terminating chunk: the client sees an incomplete body
+            self._write_event(_chunk(completion_id, model, {"content": token}, None))
+            time.sleep(delay)
+        # Like Groq, report usage in an x_groq field of the last chunk
+        usage = {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)}
+        self._write_event({**_chunk(completion_id, model, {}, "stop"), "x_groq": {"id": completion_id, "usage": usage}})
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+    def _write_event(self, payload: dict):
+        self._write_chunk(b"data: " + json.dumps(payload).encode("utf-8") + b"\n\n")
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, status: int, payload: dict, headers: Optional[dict] = None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status: int, code: str, message: str, headers: Optional[dict] = None):
+        self._send_json(status, {"error": {"message": message, "type": "invalid_request_error", "code": code}}, headers)
+
+
+def _response_tokens(body: dict, count: int, text: str = LOREM) -> list:
+    # Split on spaces only, so newlines (markdown structure) stay inside the words
+    copy = text.strip().split(" ")
+    if "\n" in text.strip():
+        copy[-1] += "\n\n" # Repeated markdown starts a new block rather than gluing onto the last line
+    words = copy * (count // len(copy) + 1)
+    # An assistant message at the end is a prefill: continue after it. Each token is one word
+    # and one space, so the spaces count the tokens already sent.
+    messages = body.get("messages") or []
+    skip = 0
+    if messages and messages[-1].get("role") == "assistant":
+        prefill = messages[-1].get("content", "")
+        skip = prefill.count(" ") + (not prefill.endswith(" ")) if prefill else 0
+    count = min(count, int(body.get("max_tokens") or count))
+    return [word + " " for word in words[skip:count]]
+
+
+def _chunk(completion_id: str, model: str, delta: dict, finish_reason: Optional[str]) -> dict:
+    return {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "logprobs": None, "finish_reason": finish_reason}],
+    }
+
+
+def _completion(model: str, content: str, completion_tokens: int) -> dict:
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": completion_tokens, "total_tokens": completion_tokens},
+    }
+
+
+def serve(config: FakeGroqConfig, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Starts the fake API on a background thread and returns the running server."""
+    handler = type("ConfiguredFakeGroqHandler", (FakeGroqHandler,), {"config": config})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--tokens-per-sec", type=float, default=200.0)
+    parser.add_argument("--response-tokens", type=int, default=60)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--unavailable-model", action="append", default=[])
+    parser.add_argument("--response-file", help="Answer with this file's text (e.g. long markdown) instead of filler")
+    parser.add_argument("--model-latency", action="append", default=[], metavar="MODEL=SECONDS",
+                        help="Latency for one model, e.g. a slow large model next to a fast draft model")
+    args = parser.parse_args()
+    model_latency = {model: float(seconds) for model, seconds in (item.rsplit("=", 1) for item in args.model_latency)}
+    config = FakeGroqConfig(args.latency, args.tokens_per_sec, args.response_tokens, args.error_rate,
+                            args.rate_limit_rate, args.retry_after, args.drop_rate, args.unavailable_model,
+                            model_latency=model_latency)
+    if args.response_file:
+        with open(args.response_file, encoding="utf-8") as file:
+            config.text = file.read()
+    server = serve(config, args.host, args.port)
+    print(f"Fake Groq API listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""Runs streamlit_app.py as several worker processes behind a round-robin proxy.
+
+Every worker shares the same state files: the chat store (transcripts, moods and
+session settings), the response cache and the rate-limit buckets. Any worker
+can therefore serve any run of any session, so the proxy (or nginx/HAProxy in
+front of `--no-proxy` workers) needs no sticky sessions:
+
+    python launch_workers.py --workers 4 --port 8501
+    python launch_workers.py --workers 4 --no-proxy -- --server.address 0.0.0.0
+
+The proxy works at the TCP level, so websocket connections pass through
+untouched; each new connection goes to the next live worker. Workers that exit
+are restarted.
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import secrets
+import subprocess
+import sys
+from typing import Dict, List, Optional
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+RESTART_DELAY = 2.0 # Seconds before a crashed worker is started again
+PROXY_BUFFER = 64 * 1024
+
+
+class Worker:
+    """One `streamlit run` process on its own port."""
+
+    def __init__(self, index: int, port: int, env: Dict[str, str], streamlit_args: List[str],
+                 log_path: Optional[str] = None):
+        self.index = index
+        self.port = port
+        self.env = env
+        self.streamlit_args = streamlit_args
+        self.log_path = log_path
+        self.connections = 0 # Proxied connections served so far
+        self.process: Optional[subprocess.Popen] = None
+
+    def start(self):
+        log = open(self.log_path, "a") if self.log_path else None
+        try:
+            self.process = subprocess.Popen([
+                sys.executable, "-m", "streamlit", "run", os.path.join(APP_DIR, "streamlit_app.py"),
+                "--server.headless", "true",
+                "--server.port", str(self.port),
+                "--server.fileWatcherType", "none",
+                "--browser.gatherUsageStats", "false",
+                *self.streamlit_args,
+            ], env=self.env, stdout=log, stderr=subprocess.STDOUT if log else None)
+        finally:
+            if log:
+                log.close()
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def stop(self):
+        if not self.alive:
+            return
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+def shared_env(base: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """Environment in which every worker points at the same state.
+
+    The chat store and response cache already default to files next to the app;
+    rate-limit buckets are process-local unless RATE_LIMIT_STORE_URL is set, so
+    a shared file is chosen here. One cookie secret keeps Streamlit's XSRF
+    tokens valid whichever worker a request reaches.
+    """
+    env = dict(os.environ if base is None else base)
+    env.setdefault("RATE_LIMIT_STORE_URL", "sqlite:///" + os.path.join(APP_DIR, "rate_limits.sqlite3"))
+    env.setdefault("STREAMLIT_SERVER_COOKIE_SECRET", secrets.token_hex(32))
+    return env
+
+
+def start_workers(ports: List[int], env: Dict[str, str], streamlit_args: List[str] = (),
+                  log_dir: Optional[str] = None) -> List[Worker]:
+    """Starts one worker per port; they're ready once /_stcore/health answers."""
+    workers = []
+    metrics_port = env.get("METRICS_PORT")
+    for index, port in enumerate(ports):
+        worker_env = dict(env)
+        if metrics_port:
+            worker_env["METRICS_PORT"] = str(int(metrics_port) + index) # One exporter per worker
+        log_path = os.path.join(log_dir, f"worker-{index}.log") if log_dir else None
+        worker = Worker(index, port, worker_env, list(streamlit_args), log_path)
+        worker.start()
+        workers.append(worker)
+    return workers
+
+
+async def _pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        while data := await reader.read(PROXY_BUFFER):
+            writer.write(data)
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def start_proxy(workers: List[Worker], port: int, host: str = "127.0.0.1") -> asyncio.AbstractServer:
+    """A TCP proxy that hands each new connection to the next worker that accepts it."""
+    turns = itertools.cycle(workers)
+
+    async def handle(client_reader: asyncio.StreamReader, client_writer: asyncio.StreamWriter):
+        for worker in itertools.islice(turns, len(workers)):
+            if not worker.alive:
+                continue
+            try:
+                upstream_reader, upstream_writer = await asyncio.open_connection("127.0.0.1", worker.port)
+            except OSError:
+                continue # Still starting up or just crashed; try the next one
+            worker.connections += 1
+            await asyncio.gather(_pipe(client_reader, upstream_writer), _pipe(upstream_reader, client_writer))
+            return
+        client_writer.close() # No worker available
+
+    return await asyncio.start_server(handle, host, port)
+
+
+async def supervise(workers: List[Worker]):
+    """Restarts workers that exit, until cancelled."""
+    while True:
+        await asyncio.sleep(RESTART_DELAY)
+        for worker in workers:
+            if not worker.alive:
+                print(f"Worker {worker.index} (port {worker.port}) exited; restarting", file=sys.stderr)
+                worker.start()
+
+
+async def run(args: argparse.Namespace):
+    first_port = args.worker_port or args.port + 1
+    ports = list(range(first_port, first_port + args.workers))
+    workers = start_workers(ports, shared_env(), args.streamlit_args, args.log_dir)
+    try:
+        tasks = [asyncio.create_task(supervise(workers))]
+        if args.no_proxy:
+            print(f"{args.workers} workers on ports {first_port}-{first_port + args.workers - 1}")
+        else:
+            server = await start_proxy(workers, args.port, args.host)
+            tasks.append(asyncio.create_task(server.serve_forever()))
+            print(f"{args.workers} workers behind http://{args.host}:{args.port}")
+        await asyncio.gather(*tasks)
+    finally:
+        for worker in workers:
+            worker.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--port", type=int, default=8501, help="Port the proxy listens on")
+    parser.add_argument("--host", default="127.0.0.1", help="Address the proxy listens on")
+    parser.add_argument("--worker-port", type=int, help="Port of the first worker (default: --port + 1)")
+    parser.add_argument("--no-proxy", action="store_true", help="Only start the workers, for an external load balancer")
+    parser.add_argument("--log-dir", help="Write each worker's output to <log-dir>/worker-N.log")
+    parser.add_argument("streamlit_args", nargs="*", help="Extra `streamlit run` options (after --)")
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
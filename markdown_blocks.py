@@ -0,0 +1,65 @@
+"""Incremental splitting of streamed markdown into top-level blocks.
+
+A streamed answer is re-rendered many times before it's complete. Rendering
+each finished block (paragraph, list, heading, fenced code, ...) once into its
+own element and re-rendering only the open last block keeps the cost of a
+flush proportional to the new text rather than to the whole answer.
+
+Splitting is conservative: a block only ends at a blank line (or a closing
+code fence) that is followed by an unindented line outside a fenced code
+block, so indented list continuations and code stay with the block they
+belong to. Each block then renders as it would within the whole text, except
+that a loose list (items separated by blank lines) shows as consecutive lists
+and a reference-style link can't see a definition in another block.
+"""
+import re
+from typing import List, Optional
+
+FENCE = re.compile(r" {0,3}(`{3,}|~{3,})")
+
+
+class MarkdownBlocks:
+    """Feeds on streamed text and hands back each block once it can no longer change."""
+
+    def __init__(self):
+        self._lines: List[str] = [] # Complete lines of the open block
+        self._partial = "" # Its unfinished last line
+        self._fence: Optional[str] = None # Opening fence while inside a fenced code block
+        self._ended = False # A blank line or closing fence was seen; the next unindented line starts a block
+
+    def feed(self, text: str) -> List[str]:
+        """Adds streamed text; returns the blocks it completed, in order."""
+        completed = []
+        *lines, self._partial = (self._partial + text).split("\n")
+        for line in lines:
+            self._start_block_if_ended(line, completed)
+            self._add_line(line)
+        # Decide on the unfinished line too, so a finished block isn't re-rendered until the next newline
+        self._start_block_if_ended(self._partial, completed)
+        return completed
+
+    @property
+    def open_block(self) -> str:
+        """The text after the last completed block (e.g. to render with a cursor)."""
+        return "\n".join(self._lines + [self._partial])
+
+    def _start_block_if_ended(self, line: str, completed: List[str]):
+        if self._ended and self._fence is None and line and not line[0].isspace():
+            completed.append("\n".join(self._lines).rstrip())
+            self._lines = []
+            self._ended = False
+
+    def _add_line(self, line: str):
+        stripped = line.strip()
+        if not self._lines and not stripped:
+            return # Blank lines between blocks belong to neither
+        self._lines.append(line)
+        if self._fence is not None:
+            if stripped and set(stripped) == {self._fence[0]} and len(stripped) >= len(self._fence):
+                self._fence = None
+                self._ended = True
+        elif (match := FENCE.match(line)) is not None:
+            self._fence = match.group(1)
+            self._ended = False
+        else:
+            self._ended = not stripped
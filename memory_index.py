@@ -0,0 +1,165 @@
+"""Local semantic memory over past messages and mood entries.
+
+Each text becomes a sparse vector of lower-cased, lightly stemmed word unigrams
+and bigrams with sublinear term frequency, L2-normalized. Queries are weighted
+by inverse document frequency, so rare, specific words ("insomnia", a name)
+count for more than everyday ones. No model download or external service is
+needed; recall works on shared vocabulary rather than paraphrase.
+
+Vectors are stored as flat NumPy arrays (column, weight, item) that grow in
+place, so adding an item is O(1) amortized and a cosine search over the whole
+index is one gather and one `bincount`. An index with a capacity forgets its
+oldest half in one batch once it's full, so memory and search time stay
+bounded however long the relationship gets.
+"""
+import math
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+SNIPPET_CHARS = 600 # Text kept per item, and the most that's ever recalled from it
+
+_WORDS = re.compile(r"[^\W_]+(?:'[^\W_]+)?")
+_STOPWORDS = frozenset(
+    "a about am an and are as at be been but by can could do does for from had has have how i i'm if in "
+    "into is it it's its just me my of on or our so still than that the their them then there these "
+    "they this to too very was we were what when which who why will with would you your".split()
+)
+
+
+class MemoryItem(NamedTuple):
+    kind: str # "user", "assistant" or "mood"
+    text: str
+    seq: Optional[int] = None # Message position in the session; None for mood entries
+
+
+def _stem(word: str) -> str:
+    # Crude suffix stripping so "sleeping", "sleeps" and "sleep" share a feature
+    for suffix in ("ing", "edly", "ed", "ly", "es", "s"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def features(text: str) -> Dict[str, float]:
+    """Sublinear term frequencies of the unigrams and bigrams in `text`."""
+    words = [_stem(w) for w in _WORDS.findall(text.lower()) if w not in _STOPWORDS]
+    counts: Dict[str, int] = {}
+    for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+        counts[feature] = counts.get(feature, 0) + 1
+    return {feature: 1.0 + math.log(count) for feature, count in counts.items()}
+
+
+class _Column:
+    """A growable 1-D NumPy array."""
+
+    def __init__(self, dtype, capacity: int = 256):
+        self.data = np.zeros(capacity, dtype=dtype)
+        self.size = 0
+
+    def extend(self, values):
+        end = self.size + len(values)
+        if end > len(self.data):
+            grown = np.zeros(max(end, len(self.data) * 2), dtype=self.data.dtype)
+            grown[:self.size] = self.data[:self.size]
+            self.data = grown
+        self.data[self.size:end] = values
+        self.size = end
+
+    def view(self) -> np.ndarray:
+        return self.data[:self.size]
+
+    def keep(self, values: np.ndarray):
+        """Replaces the contents with `values` (no longer than the current size)."""
+        self.data[:len(values)] = values
+        self.size = len(values)
+
+
+class VectorIndex:
+    """Sparse cosine index over `MemoryItem`s, in the order they were added.
+
+    With a `capacity`, adding an item to a full index first drops the oldest
+    half of the items.
+    """
+
+    def __init__(self, capacity: Optional[int] = None):
+        self.capacity = capacity
+        self._vocabulary: Dict[str, int] = {}
+        self._document_frequency = _Column(np.int32)
+        self._columns = _Column(np.int32) # Feature column of every stored weight
+        self._weights = _Column(np.float32)
+        self._owners = _Column(np.int32) # Item index of every stored weight
+        self._seqs = _Column(np.int64) # Per item; -1 for mood entries
+        self._items: List[MemoryItem] = []
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def add(self, item: MemoryItem):
+        if self.capacity is not None and len(self._items) >= self.capacity:
+            self._drop_oldest(len(self._items) - self.capacity // 2)
+        weights = features(item.text)
+        columns = []
+        for feature in weights:
+            column = self._vocabulary.get(feature)
+            if column is None:
+                column = self._vocabulary[feature] = len(self._vocabulary)
+                self._document_frequency.extend([0])
+            columns.append(column)
+        if columns:
+            values = np.fromiter(weights.values(), dtype=np.float32, count=len(weights))
+            self._document_frequency.view()[columns] += 1
+            self._columns.extend(columns)
+            self._weights.extend(values / np.linalg.norm(values))
+            self._owners.extend([len(self._items)] * len(columns))
+        self._seqs.extend([-1 if item.seq is None else item.seq])
+        self._items.append(item._replace(text=item.text[:SNIPPET_CHARS]))
+
+    def _drop_oldest(self, count: int):
+        owners = self._owners.view()
+        kept = owners >= count
+        columns = self._columns.view()
+        document_frequency = self._document_frequency.view()
+        document_frequency -= np.bincount(columns[~kept], minlength=len(document_frequency)).astype(np.int32)
+        # Renumber the features still in use, so the vocabulary doesn't grow with everything ever said
+        in_use = document_frequency > 0
+        renumbered = np.cumsum(in_use, dtype=np.int32) - 1
+        self._vocabulary = {feature: int(renumbered[column])
+                            for feature, column in self._vocabulary.items() if in_use[column]}
+        self._document_frequency.keep(document_frequency[in_use])
+        self._columns.keep(renumbered[columns[kept]])
+        self._weights.keep(self._weights.view()[kept])
+        self._owners.keep(owners[kept] - count)
+        self._seqs.keep(self._seqs.view()[count:])
+        del self._items[:count]
+
+    def search(self, query: str, k: int, before_seq: Optional[int] = None,
+               min_score: float = 0.0) -> List[Tuple[float, MemoryItem]]:
+        """Top-`k` items by cosine similarity to `query`, best first.
+
+        Messages at or after position `before_seq` (e.g. the ones already in the
+        prompt) are skipped; mood entries are always eligible.
+        """
+        if not self._items or k <= 0:
+            return []
+        query_vector = np.zeros(len(self._vocabulary), dtype=np.float32)
+        document_frequency = self._document_frequency.view()
+        for feature, weight in features(query).items():
+            column = self._vocabulary.get(feature)
+            if column is not None:
+                idf = math.log((1 + len(self._items)) / (1 + document_frequency[column])) + 1.0
+                query_vector[column] = weight * idf
+        norm = np.linalg.norm(query_vector)
+        if not norm:
+            return []
+        contributions = self._weights.view() * query_vector[self._columns.view()] / norm
+        scores = np.bincount(self._owners.view(), weights=contributions, minlength=len(self._items))
+        if before_seq is not None:
+            scores[self._seqs.view() >= before_seq] = -1.0
+        if k < len(scores):
+            candidates = np.argpartition(-scores, k)[:k]
+            top = candidates[np.argsort(-scores[candidates])]
+        else:
+            top = np.argsort(-scores)
+        return [(float(scores[i]), self._items[i]) for i in top if scores[i] > min_score]
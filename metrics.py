@@ -0,0 +1,174 @@
+"""In-process latency/throughput metrics with an OpenMetrics text exporter.
+
+Observations go into a fixed-size ring buffer, so memory stays bounded no matter
+how long the server runs; counters and gauges are kept as running totals. The
+module-level `registry` is shared by every session and page in the process.
+"""
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+RING_SIZE = 10_000 # Observations kept for quantiles and charts
+QUANTILES = (0.5, 0.95, 0.99)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Sample(NamedTuple):
+    timestamp: float
+    name: str
+    labels: Labels
+    value: float
+
+
+class MetricsRegistry:
+    def __init__(self, size: int = RING_SIZE):
+        self._samples: "deque[Sample]" = deque(maxlen=size)
+        self._counters: Dict[Tuple[str, Labels], float] = defaultdict(float)
+        self._gauges: Dict[Tuple[str, Labels], float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, value: Optional[float], **labels: str):
+        """Records one observation (e.g. a latency in seconds); None is ignored."""
+        if value is None:
+            return
+        sample = Sample(time.time(), name, _labels(labels), float(value))
+        with self._lock:
+            self._samples.append(sample)
+
+    def increment(self, name: str, amount: float = 1, **labels: str):
+        with self._lock:
+            self._counters[(name, _labels(labels))] += amount
+
+    def set_gauge(self, name: str, value: float, **labels: str):
+        with self._lock:
+            self._gauges[(name, _labels(labels))] = float(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels: str):
+        """Observes the wall time of the `with` block in seconds."""
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started_at, **labels)
+
+    def samples(self, names: Optional[Iterable[str]] = None, since: Optional[float] = None) -> List[Sample]:
+        names = set(names) if names is not None else None
+        with self._lock:
+            samples = list(self._samples)
+        return [
+            s for s in samples
+            if (names is None or s.name in names) and (since is None or s.timestamp >= since)
+        ]
+
+    def counters(self) -> Dict[Tuple[str, Labels], float]:
+        with self._lock:
+            return dict(self._counters)
+
+    def gauges(self) -> Dict[Tuple[str, Labels], float]:
+        with self._lock:
+            return dict(self._gauges)
+
+    def summaries(self) -> Dict[Tuple[str, Labels], List[float]]:
+        """Observed values grouped by metric name and labels."""
+        grouped: Dict[Tuple[str, Labels], List[float]] = defaultdict(list)
+        for sample in self.samples():
+            grouped[(sample.name, sample.labels)].append(sample.value)
+        return grouped
+
+    def render_openmetrics(self) -> str:
+        """Renders every metric in the OpenMetrics/Prometheus text format."""
+        lines: List[str] = []
+        typed = set()
+
+        def declare(name: str, kind: str):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), values in sorted(self.summaries().items()):
+            declare(name, "summary")
+            for q, value in zip(QUANTILES, quantiles(values, QUANTILES)):
+                lines.append(f"{name}{_format_labels(labels + (('quantile', f'{q:g}'),))} {value:.6g}")
+            lines.append(f"{name}_count{_format_labels(labels)} {len(values)}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {sum(values):.6g}")
+        for (name, labels), value in sorted(self.counters().items()):
+            declare(name, "counter")
+            lines.append(f"{name}_total{_format_labels(labels)} {value:g}")
+        for (name, labels), value in sorted(self.gauges().items()):
+            declare(name, "gauge")
+            lines.append(f"{name}{_format_labels(labels)} {value:g}")
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+def quantiles(values: List[float], qs: Iterable[float] = QUANTILES) -> List[float]:
+    """Nearest-rank quantiles of `values`."""
+    ordered = sorted(values)
+    if not ordered:
+        return [float("nan") for _ in qs]
+    return [ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))] for q in qs]
+
+
+def start_http_exporter(registry: "MetricsRegistry", port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serves `/metrics` in OpenMetrics text format from a daemon thread."""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render_openmetrics().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/openmetrics-text; version=1.0.0; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+_last_file_write: Dict[str, float] = {}
+
+
+def write_openmetrics_file(registry: "MetricsRegistry", path: str, min_interval: float = 0.0):
+    """Atomically replaces `path` with the current metrics (for textfile-collector scraping).
+
+    Writes are skipped if the file was written less than `min_interval` seconds ago.
+    """
+    now = time.monotonic()
+    if now - _last_file_write.get(path, float("-inf")) < min_interval:
+        return
+    _last_file_write[path] = now
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        file.write(registry.render_openmetrics())
+    os.replace(tmp_path, path)
+
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        key + '="' + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for key, value in labels
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+registry = MetricsRegistry()
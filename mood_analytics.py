@@ -0,0 +1,157 @@
+"""Columnar mood log and the vectorized statistics behind the mood insights panel.
+
+Entries are kept as two parallel NumPy arrays (an int8 mood code and a
+datetime64 timestamp) that grow in place, so even years of daily entries take a
+few kilobytes and every statistic is a handful of array operations rather than
+a loop over dicts. Building and appending to a series needs only NumPy; pandas
+is imported by the functions that return frames, i.e. once insights are shown.
+"""
+from typing import TYPE_CHECKING, Dict, Iterable, List, NamedTuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+MOODS = ["Very Low", "Low", "Okay", "Good", "Great"] # Code i scores i + 1
+_MOOD_CODES = {mood: code for code, mood in enumerate(MOODS)}
+DATE_FORMAT = "%Y-%m-%d %H:%M" # As written by the mood tracker
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+GOOD_DAY_SCORE = 4.0 # Daily average from which a day counts towards the good-days streak
+
+
+class Streaks(NamedTuple):
+    current_logging: int # Consecutive days with an entry, ending today or yesterday
+    longest_logging: int
+    current_good: int # Consecutive logged days averaging GOOD_DAY_SCORE or better
+    longest_good: int
+
+
+class MoodSeries:
+    """Append-only mood log: int8 codes into MOODS and datetime64[m] timestamps.
+
+    `version` changes with every append, so derived charts can be cached on it.
+    """
+
+    def __init__(self, capacity: int = 64):
+        self._codes = np.zeros(capacity, dtype=np.int8)
+        self._timestamps = np.zeros(capacity, dtype="datetime64[m]")
+        self.size = 0
+
+    @classmethod
+    def from_entries(cls, entries: Iterable[Dict[str, str]]) -> "MoodSeries":
+        """Builds a series from stored entries; unknown moods and bad dates are skipped."""
+        entries = list(entries)
+        series = cls(max(64, len(entries)))
+        if entries:
+            codes = np.array([_MOOD_CODES.get(e["mood"], -1) for e in entries], dtype=np.int8)
+            timestamps = _parse_dates([e["date"] for e in entries])
+            keep = (codes >= 0) & ~np.isnat(timestamps)
+            series._extend(codes[keep], timestamps[keep])
+        return series
+
+    @property
+    def version(self) -> int:
+        return self.size
+
+    def __len__(self) -> int:
+        return self.size
+
+    def append(self, entry: Dict[str, str]):
+        timestamp = _parse_dates([entry["date"]])
+        if entry["mood"] in MOODS and not np.isnat(timestamp[0]):
+            self._extend([_MOOD_CODES[entry["mood"]]], timestamp)
+
+    def _extend(self, codes, timestamps):
+        end = self.size + len(codes)
+        if end > len(self._codes):
+            capacity = max(end, len(self._codes) * 2)
+            self._codes = np.resize(self._codes, capacity)
+            self._timestamps = np.resize(self._timestamps, capacity)
+        self._codes[self.size:end] = codes
+        self._timestamps[self.size:end] = timestamps
+        self.size = end
+
+    @property
+    def codes(self) -> np.ndarray:
+        return self._codes[:self.size]
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        return self._timestamps[:self.size]
+
+    @property
+    def scores(self) -> np.ndarray:
+        return self.codes.astype(np.float32) + 1
+
+
+def _parse_dates(dates: List[str]) -> np.ndarray:
+    """DATE_FORMAT strings as datetime64[m]; malformed ones become NaT."""
+    try:
+        # DATE_FORMAT is ISO 8601 with a space, which NumPy parses in one go once it's a "T"
+        return np.array([date.replace(" ", "T") for date in dates], dtype="datetime64[m]")
+    except ValueError:
+        parsed = np.full(len(dates), np.datetime64("NaT"), dtype="datetime64[m]")
+        for i, date in enumerate(dates):
+            try:
+                parsed[i] = np.datetime64(date.replace(" ", "T"), "m")
+            except ValueError:
+                pass
+        return parsed
+
+
+def daily_scores(series: MoodSeries, rolling_days: int = 7) -> "pd.DataFrame":
+    """Average score per calendar day (NaN on days without entries) and its rolling mean."""
+    import pandas as pd
+
+    daily = pd.Series(series.scores, index=pd.DatetimeIndex(series.timestamps)).resample("D").mean()
+    return pd.DataFrame({
+        "Daily average": daily,
+        f"{rolling_days}-day average": daily.rolling(rolling_days, min_periods=1).mean(),
+    })
+
+
+def _runs(days: np.ndarray) -> np.ndarray:
+    """Length of each run of consecutive day numbers in sorted, unique `days`."""
+    if not len(days):
+        return np.zeros(0, dtype=np.int64)
+    run_ids = np.concatenate(([0], np.cumsum(np.diff(days) != 1)))
+    return np.bincount(run_ids)
+
+
+def streaks(series: MoodSeries, today: np.datetime64) -> Streaks:
+    day_numbers = series.timestamps.astype("datetime64[D]").astype(np.int64)
+    days, day_index = np.unique(day_numbers, return_inverse=True)
+    logging_runs = _runs(days)
+    # A streak is still going if the last logged day is today or yesterday
+    ongoing = bool(len(days)) and days[-1] >= np.datetime64(today, "D").astype(np.int64) - 1
+
+    # Average score per logged day from per-day sums and counts
+    averages = np.bincount(day_index, weights=series.scores, minlength=len(days)) / np.bincount(day_index, minlength=len(days))
+    good_days = days[averages >= GOOD_DAY_SCORE]
+    good_runs = _runs(good_days)
+    good_ongoing = bool(len(good_days)) and good_days[-1] == days[-1] and ongoing
+    return Streaks(
+        current_logging=int(logging_runs[-1]) if ongoing else 0,
+        longest_logging=int(logging_runs.max(initial=0)),
+        current_good=int(good_runs[-1]) if good_ongoing else 0,
+        longest_good=int(good_runs.max(initial=0)),
+    )
+
+
+def weekday_pattern(series: MoodSeries) -> "pd.DataFrame":
+    """Average score and number of entries per day of the week, Monday first."""
+    import pandas as pd
+
+    weekdays = (series.timestamps.astype("datetime64[D]").astype(np.int64) + 3) % 7 # 1970-01-01 was a Thursday
+    counts = np.bincount(weekdays, minlength=7)
+    totals = np.bincount(weekdays, weights=series.scores, minlength=7)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        averages = totals / counts
+    return pd.DataFrame({"Weekday": WEEKDAYS, "Average": averages, "Entries": counts})
+
+
+def mood_counts(series: MoodSeries) -> "pd.DataFrame":
+    import pandas as pd
+
+    return pd.DataFrame({"Mood": MOODS, "Entries": np.bincount(series.codes, minlength=len(MOODS))})
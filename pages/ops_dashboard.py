@@ -0,0 +1,100 @@
+import time
+
+import pandas as pd
+import plotly.express as px
+import streamlit as st
+
+import metrics
+
+LATENCY_METRICS = {
+    "groq_ttft_seconds": "Time to first token",
+    "groq_request_seconds": "Total generation time",
+    "cached_response_seconds": "Cached response replay",
+    "script_run_seconds": "Script rerun",
+    "admission_wait_seconds": "Rate-limit queue wait",
+    "draft_latency_saved_seconds": "Perceived latency saved by fast drafts",
+}
+WINDOWS = {"Last 15 minutes": 15 * 60, "Last hour": 60 * 60, "Last 24 hours": 24 * 60 * 60, "Everything buffered": None}
+
+st.set_page_config(page_icon="📈", layout="wide", page_title="Ops Dashboard")
+st.title("📈 Ops Dashboard")
+st.caption(
+    f"Latency and throughput recorded by this server process (last {metrics.RING_SIZE:,} observations). "
+    "Set METRICS_PORT or METRICS_FILE to export the same data in OpenMetrics format."
+)
+
+window = st.selectbox("Window", list(WINDOWS), index=1)
+if st.button("🔄 Refresh"):
+    st.rerun()
+
+since = time.time() - WINDOWS[window] if WINDOWS[window] else None
+samples = metrics.registry.samples(since=since)
+if not samples:
+    st.info("No requests recorded yet. Chat with Mnemosyne and come back here.")
+    st.stop()
+
+df = pd.DataFrame(
+    {
+        "timestamp": pd.to_datetime([s.timestamp for s in samples], unit="s"),
+        "metric": [s.name for s in samples],
+        "model": [dict(s.labels).get("model", "–") for s in samples],
+        "value": [s.value for s in samples],
+    }
+)
+
+# Percentile summary per model
+latency = df[df["metric"].isin(LATENCY_METRICS)]
+summary = (
+    latency.groupby(["metric", "model"])["value"]
+    .quantile([0.5, 0.95, 0.99])
+    .unstack()
+    .rename(columns={0.5: "p50", 0.95: "p95", 0.99: "p99"})
+)
+summary["count"] = latency.groupby(["metric", "model"])["value"].count()
+summary = summary.reset_index()
+
+for metric_name, title in LATENCY_METRICS.items():
+    rows = summary[summary["metric"] == metric_name]
+    if rows.empty:
+        continue
+    st.subheader(title)
+    long = rows.melt(id_vars=["model"], value_vars=["p50", "p95", "p99"], var_name="percentile", value_name="seconds")
+    st.plotly_chart(
+        px.bar(long, x="model", y="seconds", color="percentile", barmode="group"),
+        use_container_width=True,
+    )
+
+throughput = df[df["metric"] == "groq_tokens_per_second"]
+if not throughput.empty:
+    st.subheader("Throughput")
+    st.plotly_chart(
+        px.scatter(throughput, x="timestamp", y="value", color="model", labels={"value": "tokens / second"}),
+        use_container_width=True,
+    )
+
+# Recorded once, at the first run in the process, so not limited to the window
+phases = metrics.registry.samples(names=["startup_phase_seconds"])
+if phases:
+    st.subheader("Cold start")
+    first_paint = metrics.registry.samples(names=["startup_first_paint_seconds"])
+    st.caption(
+        "Phases of the app's first run in this process (STARTUP_PROFILE=1)"
+        + (f"; first paint after {first_paint[-1].value:.2f}s." if first_paint else ".")
+    )
+    phase_df = pd.DataFrame({"phase": [dict(s.labels)["phase"] for s in phases], "seconds": [s.value for s in phases]})
+    figure = px.bar(phase_df, x="seconds", y="phase", orientation="h")
+    figure.update_yaxes(autorange="reversed") # Run order, top to bottom
+    st.plotly_chart(figure, use_container_width=True)
+    imports = metrics.registry.samples(names=["startup_import_seconds"])
+    import_df = pd.DataFrame({"module": [dict(s.labels)["module"] for s in imports], "seconds": [s.value for s in imports]})
+    st.dataframe(import_df.sort_values("seconds", ascending=False), hide_index=True, use_container_width=True)
+
+st.subheader("Percentiles")
+st.dataframe(summary, hide_index=True, use_container_width=True)
+
+st.subheader("Counters and gauges")
+totals = [
+    {"metric": name, "labels": ", ".join(f"{k}={v}" for k, v in labels), "value": value}
+    for (name, labels), value in {**metrics.registry.counters(), **metrics.registry.gauges()}.items()
+]
+st.dataframe(pd.DataFrame(totals), hide_index=True, use_container_width=True)
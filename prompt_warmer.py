@@ -0,0 +1,105 @@
+"""Background precomputation of answers to the app's quick prompts.
+
+A `PromptWarmer` thread keeps an answer for every prompt of its current
+`WarmupTarget` in the response cache. The cache key covers the model, the
+system prompt and the sampling settings, so it doubles as the answer's
+version: a new system prompt or default model simply means new keys, which
+the thread fills right away. Answers are refreshed every `refresh_interval`.
+Workers sharing the cache's SQLite file skip answers another worker has
+already refreshed.
+"""
+import random
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from response_cache import ResponseCache, response_cache_key
+
+
+class WarmupTarget(NamedTuple):
+    model: str
+    system_prompt: str
+    temperature: float
+    max_tokens: int
+    prompts: Tuple[str, ...]
+
+    def messages(self, prompt: str) -> List[Dict[str, str]]:
+        return [{"role": "system", "content": self.system_prompt}, {"role": "user", "content": prompt}]
+
+    def key(self, prompt: str) -> str:
+        """The response cache key of a first-turn `prompt` asked with these settings."""
+        return response_cache_key(self.model, self.messages(prompt), self.temperature, self.max_tokens)
+
+
+class PromptWarmer:
+    """Keeps precomputed answers for the current target fresh, on a daemon thread.
+
+    `answer(target, prompt)` produces one answer (e.g. by calling the API).
+    The thread starts on the first `update()`.
+    """
+
+    def __init__(self, cache: ResponseCache, answer: Callable[[WarmupTarget, str], str],
+                 refresh_interval: float = 6 * 60 * 60, retry_interval: float = 60.0):
+        if refresh_interval >= cache.ttl:
+            raise ValueError("refresh_interval must be shorter than the cache TTL")
+        self.cache = cache
+        self.answer = answer
+        self.refresh_interval = refresh_interval
+        self.retry_interval = retry_interval
+        # Workers sharing a cache each wait a slightly different time, so one refreshes and the rest see it
+        self._jitter = random.uniform(0, 0.1) * refresh_interval
+        self.warmed = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None # Shown in the app's Response Cache panel
+        self._target: Optional[WarmupTarget] = None
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def target(self) -> Optional[WarmupTarget]:
+        return self._target
+
+    def update(self, target: WarmupTarget):
+        """Sets what to warm; cheap when nothing changed, so it can be called on every script run."""
+        with self._cond:
+            if target == self._target:
+                return
+            self._target = target
+            self._cond.notify_all()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="prompt-warmer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                target = self._target
+            next_due = self._warm(target)
+            with self._cond:
+                if self._target == target:
+                    self._cond.wait(timeout=max(0.0, next_due - time.time()))
+
+    def _warm(self, target: WarmupTarget) -> float:
+        """Refreshes the target's missing or stale answers; returns when the next one is due."""
+        next_due = time.time() + self.refresh_interval
+        for prompt in target.prompts:
+            if self._target != target:
+                return time.time() # Superseded: start over with the new target
+            key = target.key(prompt)
+            expires_at = self.cache.expires_at(key)
+            created_at = expires_at - self.cache.ttl if expires_at is not None else None
+            due = created_at + self.refresh_interval + self._jitter if created_at is not None else 0.0
+            if time.time() >= due:
+                try:
+                    response = self.answer(target, prompt)
+                    if not response:
+                        raise ValueError("empty answer")
+                    self.cache.put(key, response)
+                    self.warmed += 1
+                    due = time.time() + self.refresh_interval
+                except Exception as e:
+                    self.failures += 1
+                    self.last_error = f"{type(e).__name__}: {e}"
+                    due = time.time() + self.retry_interval
+            next_due = min(next_due, due)
+        return next_due
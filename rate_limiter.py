@@ -0,0 +1,358 @@
+"""Admission control for Groq calls.
+
+Each (API key, model) pair gets token buckets for requests/min and tokens/min.
+Requests that don't fit wait in a per-model queue that takes turns across
+sessions, so one busy session can't starve the others and a burst of users
+waits a moment instead of all hitting the organization's rate limit at once.
+
+The buckets live in a `BucketStore`: in process memory by default, or in a
+SQLite file that several app workers share so that together they stay under
+the organization's limits. The queue itself is per process.
+"""
+import hashlib
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from typing import Callable, Deque, Dict, List, NamedTuple, Optional, Tuple
+
+
+class RateLimits(NamedTuple):
+    requests_per_minute: float
+    tokens_per_minute: float
+
+
+class AdmissionTimeout(Exception):
+    """Raised when a request waited longer than the controller's `max_wait`."""
+
+
+class AdmissionCancelled(Exception):
+    """Raised when a queued request's caller gave up on it (its `cancelled()` turned true)."""
+
+
+class TokenBucket:
+    """Refills at `per_minute / 60` units per second up to `per_minute` units."""
+
+    def __init__(self, per_minute: float, clock: Callable[[], float] = time.monotonic):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.clock = clock
+        self.level = per_minute
+        self.updated_at = clock()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        start = max(self.updated_at, self.paused_until)
+        if now > start:
+            self.level = min(self.capacity, self.level + (now - start) * self.rate)
+        self.updated_at = max(now, self.updated_at)
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units are available (0 if they are now)."""
+        now = self.clock()
+        self._refill(now)
+        amount = min(amount, self.capacity) # Oversized requests wait for a full bucket
+        paused = max(0.0, self.paused_until - now)
+        if self.level >= amount:
+            return paused
+        return paused + (amount - self.level) / self.rate
+
+    def take(self, amount: float):
+        self._refill(self.clock())
+        self.level -= min(amount, self.capacity)
+
+    def give_back(self, amount: float):
+        """Returns units taken for work that turned out smaller, up to a full bucket."""
+        self._refill(self.clock())
+        self.level = min(self.capacity, self.level + amount)
+
+    def pause(self, seconds: float):
+        """Empties the bucket and stops refilling for `seconds`, e.g. after a 429."""
+        now = self.clock()
+        self._refill(now)
+        self.level = min(self.level, 0.0)
+        self.paused_until = max(self.paused_until, now + seconds)
+
+
+class BucketStore(ABC):
+    """Interface for where the (API key, model) bucket levels are kept."""
+
+    @abstractmethod
+    def reserve(self, api_key: str, model: str, limits: RateLimits, tokens: int, take: bool = True) -> float:
+        """Seconds until one request of `tokens` fits (0 if it does now).
+
+        With `take`, a request that fits now is also deducted from both buckets.
+        """
+
+    @abstractmethod
+    def refund(self, api_key: str, model: str, limits: RateLimits, tokens: int):
+        """Gives back `tokens` of an earlier reservation that the request didn't use."""
+
+    @abstractmethod
+    def pause(self, api_key: str, model: str, limits: RateLimits, seconds: float):
+        """Empties both buckets and holds them back for `seconds`, e.g. after a 429."""
+
+
+class LocalBucketStore(BucketStore):
+    """Buckets in this process's memory; callers serialize access."""
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self._buckets: Dict[Tuple[str, str], Tuple[TokenBucket, TokenBucket]] = {}
+
+    def reserve(self, api_key: str, model: str, limits: RateLimits, tokens: int, take: bool = True) -> float:
+        requests, token_bucket = self._key_buckets(api_key, model, limits)
+        delay = max(requests.wait_time(1), token_bucket.wait_time(tokens))
+        if take and delay == 0:
+            requests.take(1)
+            token_bucket.take(tokens)
+        return delay
+
+    def refund(self, api_key: str, model: str, limits: RateLimits, tokens: int):
+        self._key_buckets(api_key, model, limits)[1].give_back(tokens)
+
+    def pause(self, api_key: str, model: str, limits: RateLimits, seconds: float):
+        for bucket in self._key_buckets(api_key, model, limits):
+            bucket.pause(seconds)
+
+    def _key_buckets(self, api_key: str, model: str, limits: RateLimits) -> Tuple[TokenBucket, TokenBucket]:
+        if (api_key, model) not in self._buckets:
+            self._buckets[(api_key, model)] = (
+                TokenBucket(limits.requests_per_minute, self.clock),
+                TokenBucket(limits.tokens_per_minute, self.clock),
+            )
+        return self._buckets[(api_key, model)]
+
+
+class SQLiteBucketStore(BucketStore):
+    """Buckets in a SQLite file shared by every worker process on the host.
+
+    Each reservation is one `BEGIN IMMEDIATE` transaction, so two workers can't
+    both spend the same headroom. Levels are timestamped with the wall clock,
+    which all processes agree on. Keys are stored as hashes, never in the clear.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._lock = threading.Lock()
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS buckets ("
+            " name TEXT PRIMARY KEY, level REAL NOT NULL, updated_at REAL NOT NULL, paused_until REAL NOT NULL)"
+        )
+
+    def reserve(self, api_key: str, model: str, limits: RateLimits, tokens: int, take: bool = True) -> float:
+        def update(requests: TokenBucket, token_bucket: TokenBucket) -> Tuple[bool, float]:
+            delay = max(requests.wait_time(1), token_bucket.wait_time(tokens))
+            if take and delay == 0:
+                requests.take(1)
+                token_bucket.take(tokens)
+                return True, delay
+            return False, delay
+
+        return self._transaction(api_key, model, limits, update)
+
+    def refund(self, api_key: str, model: str, limits: RateLimits, tokens: int):
+        def update(requests: TokenBucket, token_bucket: TokenBucket) -> Tuple[bool, float]:
+            token_bucket.give_back(tokens)
+            return True, 0.0
+
+        self._transaction(api_key, model, limits, update)
+
+    def pause(self, api_key: str, model: str, limits: RateLimits, seconds: float):
+        def update(*buckets: TokenBucket) -> Tuple[bool, float]:
+            for bucket in buckets:
+                bucket.pause(seconds)
+            return True, 0.0
+
+        self._transaction(api_key, model, limits, update)
+
+    def _transaction(self, api_key: str, model: str, limits: RateLimits,
+                     update: Callable[[TokenBucket, TokenBucket], Tuple[bool, float]]) -> float:
+        """Loads both buckets and applies `update`, which says whether to write them back."""
+        prefix = f"{hashlib.sha256(api_key.encode()).hexdigest()[:16]}:{model}:"
+        names = (prefix + "requests", prefix + "tokens")
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                buckets = []
+                for name, per_minute in zip(names, limits):
+                    bucket = TokenBucket(per_minute, time.time)
+                    row = self._db.execute(
+                        "SELECT level, updated_at, paused_until FROM buckets WHERE name = ?", (name,)
+                    ).fetchone()
+                    if row is not None:
+                        bucket.level, bucket.updated_at, bucket.paused_until = row
+                        bucket.level = min(bucket.level, bucket.capacity) # The limit may have been lowered
+                    buckets.append(bucket)
+                changed, result = update(*buckets)
+                if changed:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO buckets (name, level, updated_at, paused_until) VALUES (?, ?, ?, ?)",
+                        [(name, b.level, b.updated_at, b.paused_until) for name, b in zip(names, buckets)],
+                    )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return result
+
+
+def create_bucket_store(url: str = "") -> BucketStore:
+    """Builds a store from a URL such as `sqlite:///rate_limits.sqlite3`; empty means in-process."""
+    if not url:
+        return LocalBucketStore()
+    if url.startswith("sqlite:///"):
+        return SQLiteBucketStore(url[len("sqlite:///"):])
+    if "://" in url:
+        raise ValueError(f"Unsupported rate-limit store URL: {url}")
+    return SQLiteBucketStore(url)
+
+
+class _Waiter:
+    def __init__(self, session_id: str, tokens: int):
+        self.session_id = session_id
+        self.tokens = tokens
+
+
+class AdmissionController:
+    """Admits requests against per-model limits, spreading them over one or more API keys.
+
+    Models without an entry in `limits` are admitted immediately.
+    """
+
+    def __init__(self, limits: Dict[str, RateLimits], api_keys: List[str], max_wait: float = 60.0,
+                 clock: Callable[[], float] = time.monotonic, buckets: Optional[BucketStore] = None,
+                 cancel_poll_interval: float = 0.5):
+        self.limits = limits
+        self.api_keys = list(api_keys)
+        self.max_wait = max_wait
+        self.cancel_poll_interval = cancel_poll_interval # Longest a cancellable waiter sleeps between checks
+        self.clock = clock
+        self.buckets = buckets if buckets is not None else LocalBucketStore(clock)
+        self._queues: Dict[str, "OrderedDict[str, Deque[_Waiter]]"] = {}
+        self._cond = threading.Condition()
+
+    def acquire(self, session_id: str, model: str, tokens: int,
+                on_wait: Optional[Callable[[int, float], None]] = None,
+                cancelled: Optional[Callable[[], bool]] = None) -> Tuple[str, float]:
+        """Blocks until the request may be sent; returns (API key to use, seconds waited).
+
+        While queued, `on_wait(position, eta_seconds)` is called whenever the
+        position changes (outside the lock), and once more with position 0 on admission.
+        `cancelled()` is checked before every attempt to get in; once it's true the
+        request leaves the line with `AdmissionCancelled`, without spending headroom.
+        """
+        if cancelled is not None and cancelled():
+            raise AdmissionCancelled(f"request for {model} was cancelled")
+        limits = self.limits.get(model)
+        if limits is None:
+            return self.api_keys[0], 0.0
+        started_at = self.clock()
+        waiter = _Waiter(session_id, tokens)
+        reported = None
+        with self._cond:
+            queue = self._queues.setdefault(model, OrderedDict())
+            queue.setdefault(session_id, deque()).append(waiter)
+            self._cond.notify_all() # Positions behind a new session's first request move back
+            try:
+                while True:
+                    if cancelled is not None and cancelled():
+                        raise AdmissionCancelled(f"request for {model} was cancelled while queued")
+                    position = self._position(queue, waiter)
+                    # Only the head of the line spends headroom; the others just estimate
+                    api_key, delay = self._best_key(model, limits, tokens, take=position == 1)
+                    if position == 1 and delay == 0:
+                        self._admit(queue, waiter)
+                        break
+                    waited = self.clock() - started_at
+                    if waited >= self.max_wait:
+                        raise AdmissionTimeout(f"{model} is busy: still #{position} in line after {waited:.1f}s")
+                    # Rough ETA: the head's refill time plus one request interval per waiter ahead
+                    eta = delay + (position - 1) * 60.0 / limits.requests_per_minute
+                    if on_wait is not None and position != reported:
+                        reported = position
+                        self._cond.release()
+                        try:
+                            on_wait(position, eta)
+                        finally:
+                            self._cond.acquire()
+                        continue # Re-check: the queue may have moved while unlocked
+                    # Other workers sharing the buckets don't notify us, so the head re-checks after `delay`
+                    timeout = min(delay if position == 1 else self.max_wait, self.max_wait - waited)
+                    if cancelled is not None:
+                        timeout = min(timeout, self.cancel_poll_interval) # Nothing notifies us of a cancel either
+                    self._cond.wait(timeout=timeout)
+            except BaseException:
+                self._remove(queue, waiter)
+                raise
+        waited = self.clock() - started_at
+        if on_wait is not None and reported is not None:
+            on_wait(0, 0.0)
+        return api_key, waited
+
+    def penalize(self, api_key: str, model: str, seconds: float):
+        """Holds a key/model pair back for `seconds` after the API rate-limited it anyway."""
+        limits = self.limits.get(model)
+        if limits is None:
+            return
+        with self._cond:
+            self.buckets.pause(api_key, model, limits, seconds)
+            self._cond.notify_all()
+
+    def refund(self, api_key: str, model: str, tokens: int):
+        """Gives back reserved tokens an admitted request didn't use (e.g. a reply shorter than max_tokens)."""
+        limits = self.limits.get(model)
+        if limits is None or tokens <= 0:
+            return
+        with self._cond:
+            self.buckets.refund(api_key, model, limits, tokens)
+            self._cond.notify_all()
+
+    def queue_length(self, model: str) -> int:
+        with self._cond:
+            return sum(len(waiters) for waiters in self._queues.get(model, {}).values())
+
+    def _best_key(self, model: str, limits: RateLimits, tokens: int, take: bool) -> Tuple[str, float]:
+        """The key that can take this request soonest; with `take`, the first that fits now is reserved."""
+        best_key, best_delay = self.api_keys[0], float("inf")
+        for api_key in self.api_keys:
+            delay = self.buckets.reserve(api_key, model, limits, tokens, take=take)
+            if delay == 0:
+                return api_key, 0.0
+            if delay < best_delay:
+                best_key, best_delay = api_key, delay
+        return best_key, best_delay
+
+    def _admit(self, queue: "OrderedDict[str, Deque[_Waiter]]", waiter: _Waiter):
+        waiters = queue[waiter.session_id]
+        waiters.popleft()
+        if waiters:
+            queue.move_to_end(waiter.session_id) # Round robin: this session goes to the back
+        else:
+            del queue[waiter.session_id]
+        self._cond.notify_all()
+
+    def _remove(self, queue: "OrderedDict[str, Deque[_Waiter]]", waiter: _Waiter):
+        waiters = queue.get(waiter.session_id)
+        if waiters and waiter in waiters:
+            waiters.remove(waiter)
+            if not waiters:
+                del queue[waiter.session_id]
+            self._cond.notify_all()
+
+    @staticmethod
+    def _position(queue: "OrderedDict[str, Deque[_Waiter]]", waiter: _Waiter) -> int:
+        """1-based place in the round-robin service order."""
+        depth = queue[waiter.session_id].index(waiter)
+        ahead, before = 0, True
+        for session_id, waiters in queue.items():
+            if session_id == waiter.session_id:
+                before = False
+            ahead += min(len(waiters), depth) # Earlier rounds
+            if before and len(waiters) > depth:
+                ahead += 1 # Sessions ahead in this round
+        return ahead + 1
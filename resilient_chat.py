@@ -0,0 +1,315 @@
+"""Retry, circuit breaking and model fallback around Groq chat-completion streams."""
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Generator, List, Optional, Tuple
+
+import groq
+import httpx
+
+from rate_limiter import AdmissionCancelled, AdmissionController, AdmissionTimeout
+
+# Errors worth retrying on the same model
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+# Statuses whose Retry-After header is a real "wait this long" hint
+RETRY_AFTER_STATUS_CODES = {429, 503}
+# Errors that mean the model itself is gone (e.g. a decommissioned preview ID)
+UNAVAILABLE_MODEL_CODES = {"model_not_found", "model_decommissioned", "model_not_active"}
+
+
+class ModelsUnavailableError(Exception):
+    """Raised when every candidate model failed or had its circuit open."""
+
+    def __init__(self, errors: Dict[str, Exception]):
+        self.errors = errors
+        detail = "; ".join(f"{model}: {error}" for model, error in errors.items()) or "no healthy model"
+        super().__init__(f"All models failed ({detail})")
+
+
+class CircuitBreaker:
+    """Stops sending requests to a model after `threshold` consecutive failures.
+
+    After `cooldown` seconds one trial request is let through (half-open); a
+    success closes the circuit again, a failure re-opens it. A trial that never
+    reports back (abandoned, or queued elsewhere) frees the slot after another
+    `cooldown`.
+    """
+
+    def __init__(self, threshold: int = 3, cooldown: float = 60.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.open_until = 0.0
+        self.probe_started_at: Optional[float] = None # When the half-open trial request was let through
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.failures < self.threshold and time.monotonic() >= self.open_until:
+            return "closed"
+        return "open" if time.monotonic() < self.open_until else "half-open"
+
+    def allow(self) -> bool:
+        """Whether a request may go out now; in the half-open state only the first caller gets True."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self.open_until:
+                return False
+            if self.failures < self.threshold:
+                return True
+            if self.probe_started_at is not None and now - self.probe_started_at < self.cooldown:
+                return False # Another request is already trying the model
+            self.probe_started_at = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.open_until = 0.0
+            self.probe_started_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.probe_started_at = None
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.open_until = time.monotonic() + self.cooldown
+
+    def open_for(self, seconds: float):
+        """Opens the circuit immediately, e.g. for a long rate-limit reset or a removed model."""
+        with self._lock:
+            self.probe_started_at = None
+            self.failures = max(self.failures, self.threshold)
+            self.open_until = max(self.open_until, time.monotonic() + seconds)
+
+
+class ResilientChat:
+    """Streams chat completions with retries, per-model circuit breakers and fallback.
+
+    One instance is shared by every session so breaker state reflects the whole
+    process. The wrapped client should be created with `max_retries=0` so the
+    SDK's own retries don't stack on top of these.
+
+    With an `admission` controller, every attempt first waits for its turn under
+    the model's rate limits; `clients` maps each of the controller's API keys to
+    a client, and `request_cost(model, request)` estimates the tokens an attempt uses.
+    The estimate must cover the whole `max_tokens`; once a stream ends, the part
+    of it the reply didn't use is refunded to the controller.
+    """
+
+    def __init__(self, client, max_retries: int = 3, base_delay: float = 0.5, max_delay: float = 8.0,
+                 breaker_threshold: int = 3, breaker_cooldown: float = 60.0,
+                 sleep: Callable[[float], None] = time.sleep,
+                 admission: Optional[AdmissionController] = None, clients: Optional[Dict[str, Any]] = None,
+                 request_cost: Callable[[str, dict], int] = lambda model, request: request.get("max_tokens") or 0):
+        self.client = client
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.sleep = sleep
+        self.admission = admission
+        self.clients = clients or {}
+        self.request_cost = request_cost
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        with self._lock:
+            if model not in self._breakers:
+                self._breakers[model] = CircuitBreaker(self.breaker_threshold, self.breaker_cooldown)
+            return self._breakers[model]
+
+    def is_healthy(self, model: str) -> bool:
+        """Whether the model's circuit isn't open; unlike `allow()`, doesn't take the half-open trial."""
+        return self.breaker(model).state != "open"
+
+    def stream(self, candidates: List[str], request_for: Callable[[str], dict], session_id: str = "",
+               on_wait: Optional[Callable[[int, float], None]] = None,
+               stop: Optional[threading.Event] = None) -> "ResilientStream":
+        """Streams from the first healthy model in `candidates`.
+
+        `request_for(model)` returns the remaining `chat.completions.create`
+        arguments (messages, max_tokens, ...) sized for that model. `session_id`
+        and `on_wait` are passed to the admission controller, if there is one.
+        Once `stop` is set, the stream ends quietly before its next admission or
+        request, so an abandoned stream spends no more rate-limit budget.
+        """
+        return ResilientStream(self, candidates, request_for, session_id, on_wait, stop)
+
+    def admit(self, session_id: str, model: str, request: dict,
+              on_wait: Optional[Callable[[int, float], None]] = None,
+              cancelled: Optional[Callable[[], bool]] = None) -> Tuple[Any, Optional[str], float]:
+        """Waits for the model's rate limits; returns (client, API key, seconds waited)."""
+        if self.admission is None:
+            return self.client, None, 0.0
+        api_key, waited = self.admission.acquire(session_id, model, self.request_cost(model, request), on_wait,
+                                                 cancelled)
+        return self.clients.get(api_key, self.client), api_key, waited
+
+    def refund(self, api_key: Optional[str], model: str, request: dict, completion_tokens: int):
+        """Returns the unused part of an admitted attempt's `max_tokens` to the rate limits."""
+        if self.admission is not None and api_key is not None:
+            self.admission.refund(api_key, model, (request.get("max_tokens") or 0) - completion_tokens)
+
+    def backoff(self, attempt: int, error: Optional[Exception] = None) -> float:
+        """Full-jitter exponential backoff, never shorter than a server's retry hint."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        hint = retry_after(error) if error is not None else None
+        return max(delay, hint) if hint is not None else delay
+
+
+class ResilientStream:
+    """Iterates response deltas; `model` names the model that finished the answer."""
+
+    def __init__(self, chat: ResilientChat, candidates: List[str], request_for: Callable[[str], dict],
+                 session_id: str = "", on_wait: Optional[Callable[[int, float], None]] = None,
+                 stop: Optional[threading.Event] = None):
+        self.chat = chat
+        self.candidates = candidates
+        self.request_for = request_for
+        self.session_id = session_id
+        self.on_wait = on_wait
+        self.stop = stop
+        self.model: Optional[str] = None
+        self.errors: Dict[str, Exception] = {}
+        self.retries = 0
+        self.resumed = 0
+        self.queued_seconds = 0.0 # Time spent waiting for admission
+
+    def __iter__(self) -> Generator[str, None, None]:
+        parts: List[str] = []
+        for model in self.candidates:
+            breaker = self.chat.breaker(model)
+            attempt = 0
+            if self._stopped(): # Checked before allow(), which may hand out the half-open trial
+                return
+            while breaker.allow():
+                request = dict(self.request_for(model))
+                if parts:
+                    # Resume a broken stream: prefill what was already shown and let the model continue
+                    request["messages"] = list(request["messages"]) + [{"role": "assistant", "content": "".join(parts)}]
+                    self.resumed += 1
+                try:
+                    client, api_key, waited = self.chat.admit(self.session_id, model, request, self.on_wait,
+                                                              self._stopped)
+                    self.queued_seconds += waited
+                except AdmissionCancelled:
+                    return
+                except AdmissionTimeout as e:
+                    self.errors[model] = e # Busy, not broken: leave the breaker alone and try the next model
+                    break
+                if self._stopped():
+                    self.chat.refund(api_key, model, request, 0) # Stopped while it was being admitted
+                    return
+                chat_completion_stream = None
+                received = 0 # Content deltas, roughly one token each
+                used = None # Completion tokens as reported in the final chunk's usage
+                try:
+                    chat_completion_stream = client.chat.completions.create(model=model, stream=True, **request)
+                    for chunk in chat_completion_stream:
+                        used = completion_tokens(chunk, used)
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            received += 1
+                            parts.append(chunk.choices[0].delta.content)
+                            yield chunk.choices[0].delta.content
+                except Exception as e:
+                    kind = classify_error(e)
+                    if kind == "fatal":
+                        raise
+                    self.errors[model] = e
+                    if kind == "unavailable":
+                        breaker.open_for(self.chat.breaker_cooldown)
+                        break
+                    breaker.record_failure()
+                    delay = self.chat.backoff(attempt, e)
+                    if api_key is not None and getattr(e, "status_code", None) == 429:
+                        self.chat.admission.penalize(api_key, model, delay) # Our limits were too generous
+                    if attempt >= self.chat.max_retries or delay > self.chat.max_delay:
+                        if delay > self.chat.max_delay:
+                            breaker.open_for(delay) # Rate limited for longer than we'd keep a user waiting
+                        break
+                    self.retries += 1
+                    attempt += 1
+                    self.chat.sleep(delay)
+                    if self._stopped():
+                        return
+                    continue
+                finally:
+                    if chat_completion_stream is not None:
+                        # Also runs when the consumer stops early (GeneratorExit), so the HTTP
+                        # connection is released now rather than whenever the stream is collected
+                        chat_completion_stream.close()
+                        # Rejected requests (no stream) keep their reservation
+                        self.chat.refund(api_key, model, request, received if used is None else used)
+                breaker.record_success()
+                self.model = model
+                return
+        raise ModelsUnavailableError(self.errors)
+
+    def _stopped(self) -> bool:
+        return self.stop is not None and self.stop.is_set()
+
+
+def fallback_order(selected: str, model_ids: List[str]) -> List[str]:
+    """The selected model first, then the rest of the registry in order after it."""
+    if selected not in model_ids:
+        return list(model_ids)
+    index = model_ids.index(selected)
+    return model_ids[index:] + model_ids[:index]
+
+
+def completion_tokens(chunk, default: Optional[int] = None) -> Optional[int]:
+    """Completion tokens reported by a stream chunk (Groq sends usage in `x_groq` of the last one)."""
+    usage = getattr(getattr(chunk, "x_groq", None), "usage", None) or getattr(chunk, "usage", None)
+    return usage.completion_tokens if usage is not None else default
+
+
+def classify_error(error: Exception) -> str:
+    """Sorts an error into "retryable", "unavailable" (try another model) or "fatal"."""
+    if isinstance(error, (groq.APIConnectionError, httpx.TransportError)):
+        return "retryable"
+    if isinstance(error, groq.APIStatusError):
+        code = _error_code(error)
+        if error.status_code == 404 or code in UNAVAILABLE_MODEL_CODES:
+            return "unavailable"
+        if error.status_code in RETRYABLE_STATUS_CODES or error.status_code >= 500:
+            return "retryable"
+        return "fatal"
+    if isinstance(error, groq.APIError):
+        return "retryable" # Error event in the middle of a stream
+    return "fatal"
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Seconds a 429 or 503 asked us to wait with Retry-After, if it did.
+
+    Groq's x-ratelimit-reset-* headers are deliberately ignored: they come with
+    every response and reset-requests is when the daily budget is full again,
+    not how long to back off.
+    """
+    response = getattr(error, "response", None)
+    if response is None or getattr(error, "status_code", None) not in RETRY_AFTER_STATUS_CODES:
+        return None
+    headers = response.headers
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    if headers.get("retry-after"):
+        try:
+            return float(headers["retry-after"])
+        except ValueError:
+            pass
+    return None
+
+
+def _error_code(error: groq.APIStatusError) -> Optional[str]:
+    body = error.body
+    if isinstance(body, dict):
+        body = body.get("error", body)
+        if isinstance(body, dict):
+            return body.get("code")
+    return None
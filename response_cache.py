@@ -0,0 +1,160 @@
+"""Response cache for Mnemosyne: an in-memory LRU tier backed by SQLite."""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+
+def response_cache_key(model: str, messages: List[Dict[str, str]], temperature: float, max_tokens: int) -> str:
+    """Hashes everything that shapes a response into a stable cache key."""
+    normalized = [
+        {"role": m["role"], "content": " ".join(m["content"].split())} for m in messages
+    ]
+    payload = json.dumps(
+        {
+            "model": model,
+            "messages": normalized,
+            "temperature": round(float(temperature), 2),
+            "max_tokens": int(max_tokens),
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Thread-safe response cache shared by every session in the process.
+
+    Entries live in an LRU memory tier capped at `max_bytes` and in an optional
+    SQLite file (capped at `disk_max_bytes`) so they survive restarts and are
+    shared by every worker pointed at the same file. Both tiers expire entries
+    after `ttl` seconds.
+    """
+
+    def __init__(self, db_path: Optional[str] = None, max_bytes: int = 16 * 1024 * 1024,
+                 disk_max_bytes: int = 64 * 1024 * 1024, ttl: float = 24 * 60 * 60):
+        self.max_bytes = max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict() # key -> (expires_at, response)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=10) # Other workers may hold the write lock
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, response TEXT NOT NULL,"
+                " size INTEGER NOT NULL, created_at REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_created_at ON responses (created_at)")
+            self._db.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                self._remove(key)
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT response, expires_at FROM responses WHERE key = ? AND expires_at > ?", (key, now)
+                ).fetchone()
+                if row is not None:
+                    self._insert(key, row[0], row[1]) # Promote to the memory tier
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return row[0]
+            self.misses += 1
+            return None
+
+    def expires_at(self, key: str) -> Optional[float]:
+        """When a live entry expires (None if there is none), without counting a hit or miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                return entry[0]
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT expires_at FROM responses WHERE key = ? AND expires_at > ?", (key, now)
+                ).fetchone()
+                if row is not None:
+                    return row[0]
+            return None
+
+    def put(self, key: str, response: str):
+        now = time.time()
+        expires_at = now + self.ttl
+        with self._lock:
+            self._insert(key, response, expires_at)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, response, size, created_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, response, _size(response), now, expires_at),
+                )
+                self._prune_disk(now)
+                self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+    def _insert(self, key: str, response: str, expires_at: float):
+        if key in self._entries:
+            self._remove(key)
+        size = _size(response)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (expires_at, response)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries))) # Least recently used first
+
+    def _remove(self, key: str):
+        _, response = self._entries.pop(key)
+        self._bytes -= _size(response)
+
+    def _prune_disk(self, now: float):
+        self._db.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.disk_max_bytes:
+            return
+        # Drop the oldest rows until the file is back under its cap
+        excess = total - self.disk_max_bytes
+        for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY created_at").fetchall():
+            if excess <= 0:
+                break
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            excess -= size
+
+
+def _size(response: str) -> int:
+    return len(response.encode("utf-8"))
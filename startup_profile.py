@@ -0,0 +1,108 @@
+"""Opt-in timing of a worker's cold start of streamlit_app.py.
+
+With STARTUP_PROFILE=1, the first run of the app script in each process is
+split into the phases it marks (imports, page config, CSS, first paint, client
+setup, ...), and every module imported for the first time during that run is
+timed. When the run ends, a table goes to stderr and the numbers are recorded
+as metrics (`startup_phase_seconds`, `startup_import_seconds` and
+`startup_first_paint_seconds`) for the ops dashboard and /metrics. Every other
+run gets a profile whose methods do nothing.
+"""
+import builtins
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import metrics
+
+ENABLED = os.environ.get("STARTUP_PROFILE", "").lower() in ("1", "true", "yes")
+REPORTED_IMPORTS = 10 # Slowest imports listed in the stderr report
+
+
+class StartupProfile:
+    """Phase and import timings of one script run."""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.started_at = time.perf_counter()
+        self.phases: List[Tuple[str, float]] = [] # (name, seconds) in run order
+        self.imports: Dict[str, float] = defaultdict(float) # Top-level import statement -> seconds
+        self.first_paint: Optional[float] = None # Seconds from the start of the run
+        self.finished = not enabled
+        self._last_mark = self.started_at
+        self._thread = threading.current_thread()
+        self._import = builtins.__import__
+        self._importing = False
+        if enabled:
+            builtins.__import__ = self._timed_import
+
+    def mark(self, phase: str, first_paint: bool = False):
+        """Ends `phase`, which began at the previous mark; `first_paint` once the page shows something."""
+        if self.finished:
+            return
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last_mark))
+        self._last_mark = now
+        if first_paint and self.first_paint is None:
+            self.first_paint = now - self.started_at
+
+    def finish(self):
+        """Stops timing imports, then reports to stderr and the metrics registry."""
+        if self.finished:
+            return
+        self.finished = True
+        if builtins.__import__ == self._timed_import:
+            builtins.__import__ = self._import
+        total = time.perf_counter() - self.started_at
+        for phase, seconds in self.phases:
+            metrics.registry.observe("startup_phase_seconds", seconds, phase=phase)
+        for module, seconds in self.imports.items():
+            metrics.registry.observe("startup_import_seconds", seconds, module=module)
+        metrics.registry.observe("startup_first_paint_seconds", self.first_paint)
+        print(self.report(total), file=sys.stderr)
+
+    def report(self, total: float) -> str:
+        lines = [f"Startup profile of the first run in process {os.getpid()} ({total:.3f}s):"]
+        elapsed = 0.0
+        for phase, seconds in self.phases:
+            elapsed += seconds
+            lines.append(f"  {phase:<28} {seconds:8.3f}s  (at {elapsed:.3f}s)")
+        if self.first_paint is not None:
+            lines.append(f"  first paint at {self.first_paint:.3f}s")
+        slowest = sorted(self.imports.items(), key=lambda item: item[1], reverse=True)[:REPORTED_IMPORTS]
+        if slowest:
+            lines.append("  slowest imports:")
+            lines.extend(f"    {module:<26} {seconds:8.3f}s" for module, seconds in slowest)
+        return "\n".join(lines)
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        # Only the outermost import of a new module on the profiled thread; what it pulls in counts towards it
+        if (self._importing or level or name in sys.modules
+                or threading.current_thread() is not self._thread):
+            return self._import(name, globals, locals, fromlist, level)
+        self._importing = True
+        started_at = time.perf_counter()
+        try:
+            return self._import(name, globals, locals, fromlist, level)
+        finally:
+            self.imports[name] += time.perf_counter() - started_at
+            self._importing = False
+
+
+_first_run: Optional[StartupProfile] = None
+_lock = threading.Lock()
+
+
+def begin() -> StartupProfile:
+    """The profile for this script run: live for the process's first run if ENABLED, inert otherwise."""
+    global _first_run
+    with _lock:
+        if _first_run is None and ENABLED:
+            _first_run = StartupProfile()
+            return _first_run
+    if _first_run is not None and not _first_run._thread.is_alive():
+        _first_run.finish() # The first run ended early (st.stop, a rerun): report what it got through
+    return StartupProfile(enabled=False)
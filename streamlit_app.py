@@ -1,19 +1,82 @@
+import startup_profile
+startup = startup_profile.begin() # Times this run's phases if STARTUP_PROFILE is set and it's the process's first
 import streamlit as st
-from typing import Generator, Optional, Dict, Union
+from typing import Generator, Optional, Dict, Tuple, Union
 from groq import Groq
+from response_cache import ResponseCache, response_cache_key
+from resilient_chat import ResilientChat, ResilientStream, fallback_order
+from rate_limiter import AdmissionController, RateLimits, create_bucket_store
+from chat_store import ChatStore, create_chat_store
+from assets import Asset, audio_asset, image_asset
+from token_estimator import message_tokens, prompt_overhead
+from markdown_blocks import MarkdownBlocks
+from memory_index import MemoryItem, VectorIndex
+from prompt_warmer import PromptWarmer, WarmupTarget
+from mood_analytics import MOODS, MoodSeries, daily_scores, mood_counts, streaks, weekday_pattern
+import numpy as np
+import metrics
 import os
 import random
+import re
 from pathlib import Path
 import time
+import queue
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+startup.mark("imports")
+
+script_started_at = time.perf_counter() # For the script_run_seconds metric
 
 # --- Configuration ---
 PAGE_TITLE = "Vers3Dynamics"
 PAGE_ICON = "👩‍⚕️"
 IMAGE_PATH = os.path.join("images", "1000007114-removebg-preview.png")
 IMAGE_CAPTION = "You Are the Master of Your Fate"
+IMAGE_WIDTH = 300 # Display width in CSS pixels; the WebP rendition is sized for it
+INTRO_AUDIO_PATH = "Intro.mp3"
 DEFAULT_MODEL_INDEX = 6 # Adjust if you want the new model to be default (index 6)
+DEFAULT_MAX_TOKENS = 2048 # Initial "Max Tokens" slider value (capped by the model's limit)
+DEFAULT_TEMPERATURE = 0.7 # Initial "Creativity" slider value
 APP_NAME = "Mnemosyne"
 APP_TAGLINE = "Early Intervention Mental Health Companion 🌿"
+STREAM_FLUSH_INTERVAL = 0.05 # Seconds between placeholder updates while streaming
+STREAM_FLUSH_CHARS = 64 # ...or flush sooner once this many characters are buffered
+CONTEXT_SAFETY_MARGIN = 0.03 # Share of each context window left free to absorb token estimate error
+MIN_REPLY_TOKENS = 256 # Room every request leaves for the reply; a longer latest message is refused or cut
+TRUNCATION_NOTE = "\n\n[Message shortened to fit the model's context window]"
+COMPARE_MAX_WORKERS = 4 # Upper bound on concurrent model requests in compare mode
+DRAFT_MODEL = "llama-3.2-1b-preview" # Streams a quick draft in "fast first response" mode
+DRAFT_MAX_TOKENS = 512 # The draft is replaced anyway, so it needn't be long
+RESPONSE_CACHE_PATH = os.environ.get(
+    "RESPONSE_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "response_cache.sqlite3")
+)
+RESPONSE_CACHE_TTL = 24 * 60 * 60 # Seconds a cached first-turn answer stays valid
+RESPONSE_CACHE_MAX_BYTES = 16 * 1024 * 1024 # In-memory tier size cap
+RESPONSE_CACHE_DISK_MAX_BYTES = 64 * 1024 * 1024 # SQLite tier size cap
+QUICK_PROMPT_REFRESH_INTERVAL = 6 * 60 * 60 # Seconds between background refreshes of precomputed quick-prompt answers
+QUICK_PROMPT_RETRY_INTERVAL = 60 # ...or until retrying one that failed
+WARMUP_SESSION_ID = "quick-prompt-warmup" # Rate-limit queue identity of the warm-up thread
+CHAT_STORE_URL = os.environ.get(
+    "CHAT_STORE_URL", os.path.join(os.path.dirname(os.path.abspath(__file__)), "chat_history.sqlite3")
+)
+SESSION_ID = re.compile(r"[0-9a-f]{32}") # uuid4().hex: 122 random bits, so a `?sid=` can't be guessed
+MESSAGES_IN_MEMORY = 200 # Older turns are evicted from session state and stay on disk only
+MOODS_IN_MEMORY = 30 # Recent mood entries kept in session state as text
+MOOD_ROLLING_DAYS = 7 # Window of the rolling average in the mood insights chart
+MOOD_CHART_HEIGHT = 260
+HISTORY_PAGE_SIZE = 20 # Messages rendered per rerun, and added by each "load earlier" click
+MEMORY_TOP_K = 4 # Past messages/mood entries recalled per request
+MEMORY_MIN_SCORE = 0.1 # Cosine similarity below which a memory isn't worth the tokens
+# Newest messages/mood entries kept recallable; a full index forgets its oldest half. Tied to
+# MESSAGES_IN_MEMORY so the index (600-character snippets) stays as bounded per session as the history.
+MEMORY_CAPACITY = 2 * MESSAGES_IN_MEMORY
+ADMISSION_MAX_WAIT = 60 # Seconds a request may queue for rate-limit headroom before trying another model
+# e.g. sqlite:///rate_limits.sqlite3 so several workers share one set of rate-limit buckets; empty keeps them in process
+RATE_LIMIT_STORE_URL = os.environ.get("RATE_LIMIT_STORE_URL", "")
+METRICS_PORT = os.environ.get("METRICS_PORT") # Serve OpenMetrics text on :METRICS_PORT/metrics when set
+METRICS_FILE = os.environ.get("METRICS_FILE") # ...and/or write it to this file
+METRICS_FILE_INTERVAL = 10 # Seconds between rewrites of METRICS_FILE
 
 # Poem for You (Easter egg)
 POEM = """
@@ -56,6 +119,14 @@ Not lost. Only shifting. If you hear the echo, you are already part of it.
 """
 
 # Enhanced loading messages with supportive tone
+QUICK_PROMPTS = [
+    "What are early signs of anxiety I should watch for?",
+    "How can I spot depression early?",
+    "What self-care helps with stress?",
+    "Explain biological factors in mental health",
+    "What are early intervention tips for psychosis?"
+]
+
 LOADING_MESSAGES = [
     "Gathering insights for your well-being... 🧠",
     "Exploring ways to support you... 🌱",
@@ -70,14 +141,18 @@ LOADING_MESSAGES = [
 ]
 
 # --- Enhanced System Prompt ---
+SYSTEM_PROMPT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "system_prompt.txt")
+
+@st.cache_data(show_spinner=False, max_entries=1)
+def _read_system_prompt(file_path: str, mtime: float) -> str:
+    # mtime is only part of the cache key: editing the file reloads it, otherwise
+    # every session and chat reset shares the copy already in memory
+    with open(file_path, "r", encoding="utf-8") as file:
+        return file.read()
+
 def _get_system_prompt() -> str:
-    # Ensure this function correctly determines the directory
-    # If running from the same directory as system_prompt.txt:
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    file_path = os.path.join(current_dir, "system_prompt.txt")
     try:
-        with open(file_path, "r", encoding="utf-8") as file:
-            return file.read()
+        return _read_system_prompt(SYSTEM_PROMPT_PATH, os.stat(SYSTEM_PROMPT_PATH).st_mtime)
     except FileNotFoundError:
         # Fallback if file is not found
         print("Warning: system_prompt.txt not found. Using default system prompt.") # Added print warning
@@ -93,9 +168,9 @@ def _get_system_prompt() -> str:
         return """Fallback: You are Mnemosyne, here to support mental health awareness with empathy."""
 
 # --- Enhanced CSS with Accessibility ---
-def load_css(theme="light"):
-    if theme == "dark":
-        st.markdown("""
+# Plain string constants, so applying a theme only re-sends the stored stylesheet
+THEME_CSS = {
+    "dark": """
         <style>
             .stApp {
                 background-color: #1a1a2e;
@@ -151,9 +226,8 @@ def load_css(theme="light"):
                 outline: 3px solid #BA55D3 !important;
             }
         </style>
-        """, unsafe_allow_html=True)
-    else:
-        st.markdown("""
+        """,
+    "light": """
         <style>
             .stApp {
                 background-color: #f5f7fa;
@@ -209,48 +283,267 @@ def load_css(theme="light"):
                 outline: 3px solid #9370DB !important;
             }
         </style>
-        """, unsafe_allow_html=True)
+        """,
+}
+
+def load_css(theme="light"):
+    st.markdown(THEME_CSS["dark" if theme == "dark" else "light"], unsafe_allow_html=True)
+
+# --- Context Window Management ---
+class ContextWindow:
+    """Keeps a running token count per message and fits history into a model's budget.
+
+    Counts are computed once per message and tokenizer family as the history
+    grows, so fitting a request never rescans the whole transcript. The system
+    prompt at index 0 is always kept; the oldest turns after it are dropped first.
+    """
+
+    def __init__(self):
+        self._messages = None # The history list the counts belong to
+        self._counts: Dict[str, list] = {} # Per tokenizer family
+        self._totals: Dict[str, int] = {}
+
+    def sync(self, messages: list, family: str):
+        # A new list (e.g. after a chat reset) invalidates every family's counts
+        if messages is not self._messages:
+            self._messages = messages
+            self._counts, self._totals = {}, {}
+        counts = self._counts.setdefault(family, [])
+        if len(messages) < len(counts): # The list shrank
+            counts.clear()
+            self._totals[family] = 0
+        for message in messages[len(counts):]:
+            count = message_tokens(message, family)
+            counts.append(count)
+            self._totals[family] = self._totals.get(family, 0) + count
+
+    def total(self, messages: list, family: str) -> int:
+        """Tokens the whole history takes for `family`, reply priming included."""
+        self.sync(messages, family)
+        return self._totals[family] + prompt_overhead(family)
+
+    def fit(self, messages: list, token_limit: int, max_tokens: int, family: str) -> Tuple[list, int]:
+        """Returns the messages to send so prompt plus `max_tokens` fits `token_limit`, and their token count."""
+        total = self.total(messages, family)
+        counts = self._counts[family]
+        budget = token_limit - max_tokens
+        start = 1
+        # Drop the oldest turns, but always keep the latest message
+        while total > budget and start < len(messages) - 1:
+            total -= counts[start]
+            start += 1
+        # Don't open the trimmed history with a dangling assistant reply
+        while start < len(messages) - 1 and messages[start]["role"] == "assistant":
+            total -= counts[start]
+            start += 1
+        if start == 1:
+            return messages, total
+        return messages[:1] + messages[start:], total
+
+# --- Persistent Storage ---
+# Session settings kept in the chat store, and the widget (if any) that displays each
+SESSION_SETTINGS = {"theme": "theme_radio", "selected_model": "model_select", "show_welcome": None}
+
+@st.cache_resource(show_spinner=False)
+def get_chat_store() -> ChatStore:
+    """Process-wide store for transcripts and mood logs (SQLite in WAL mode by default)."""
+    return create_chat_store(CHAT_STORE_URL)
+
+def append_message(role: str, content: str):
+    """Appends a message to the history and persists it in the chat store.
+
+    Only the newest MESSAGES_IN_MEMORY messages stay in session state; older
+    ones are evicted in one batch and remain readable from the store.
+    """
+    seq, revision = get_chat_store().append_message(st.session_state.session_id, role, content)
+    note_own_write(revision)
+    st.session_state.memory_index.add(MemoryItem(role, content, seq))
+    messages = st.session_state.messages
+    messages.append({"role": role, "content": content})
+    if len(messages) - 1 > MESSAGES_IN_MEMORY:
+        evict = len(messages) - 1 - MESSAGES_IN_MEMORY // 2
+        # A new list, so ContextWindow recounts against the shorter history
+        st.session_state.messages = messages[:1] + messages[1 + evict:]
+        st.session_state.messages_on_disk_only += evict
+
+def load_session_messages():
+    """Loads the newest MESSAGES_IN_MEMORY stored messages into session state."""
+    stored_messages = get_chat_store().load_messages(st.session_state.session_id, limit=MESSAGES_IN_MEMORY)
+    st.session_state.messages = [{"role": "system", "content": _get_system_prompt()}] + [
+        {"role": m["role"], "content": m["content"]} for m in stored_messages
+    ]
+    # Number of older messages that only live in the store
+    st.session_state.messages_on_disk_only = stored_messages[0]["seq"] - 1 if stored_messages else 0
+
+def note_own_write(revision: int):
+    """Advances the session's known store revision past a write made by this run.
+
+    If the store skipped ahead, another worker or tab wrote in between; the
+    known revision is left behind so the next run resyncs.
+    """
+    if revision == st.session_state.store_revision + 1:
+        st.session_state.store_revision = revision
+
+def save_setting(name: str, value):
+    """Sets a session setting and persists it, so any worker serving the session's next run sees it."""
+    st.session_state[name] = value
+    get_chat_store().save_setting(st.session_state.session_id, name, value)
+
+def sync_with_store():
+    """Catches session state up with settings and turns stored by another worker or tab.
+
+    With several workers behind a load balancer, a reconnecting tab may land on
+    a worker whose copy of the session is stale. Every stored message, mood or
+    reset bumps the session's revision in the store, so when nothing changed
+    this costs two indexed lookups per full run.
+    """
+    store = get_chat_store()
+    session_id = st.session_state.session_id
+    for name, value in store.load_settings(session_id).items():
+        if name in SESSION_SETTINGS and st.session_state.get(name) != value:
+            st.session_state[name] = value
+            if SESSION_SETTINGS[name] is not None:
+                st.session_state.pop(SESSION_SETTINGS[name], None) # Rebuild the widget from the new value
+    revision = store.revision(session_id)
+    if revision == st.session_state.store_revision:
+        return
+    # Read before reloading, so a write racing with the reload is picked up by the next run
+    st.session_state.store_revision = revision
+    load_session_messages()
+    st.session_state.memory_index = build_memory_index(session_id)
+    st.session_state.earlier_messages = {"until": 0, "messages": []}
+    st.session_state.mood_log = store.load_moods(session_id, limit=MOODS_IN_MEMORY)
+    st.session_state.mood_series = MoodSeries.from_entries(store.load_moods(session_id))
+
+def visible_history() -> list:
+    """The newest `history_visible` messages, reading older pages from the store if needed."""
+    in_memory = st.session_state.messages[1:] # Skip the system prompt (index 0)
+    visible = st.session_state.history_visible
+    if visible <= len(in_memory):
+        return in_memory[-visible:]
+    on_disk_only = st.session_state.messages_on_disk_only
+    earlier = st.session_state.earlier_messages
+    if earlier["until"] != on_disk_only:
+        # More turns were evicted since the cached pages were read; start over
+        earlier["until"], earlier["messages"] = on_disk_only, []
+    missing = min(visible - len(in_memory), on_disk_only) - len(earlier["messages"])
+    if missing > 0:
+        # Stored messages never change, so each earlier page is read once per session
+        page = get_chat_store().load_messages(
+            st.session_state.session_id, limit=missing, before_seq=on_disk_only - len(earlier["messages"]) + 1
+        )
+        earlier["messages"] = [{"role": m["role"], "content": m["content"]} for m in page] + earlier["messages"]
+    return (earlier["messages"] + in_memory)[-visible:]
+
+# --- Retrieval Memory ---
+MEMORY_LABELS = {"user": "User said", "assistant": "You replied", "mood": "Mood log"}
+
+def mood_memory(entry: Dict[str, str]) -> MemoryItem:
+    return MemoryItem("mood", f"{entry['date']}: feeling {entry['mood']}. {entry['notes']}".strip())
+
+def build_memory_index(session_id: str) -> VectorIndex:
+    """Indexes a session's newest MEMORY_CAPACITY messages and mood entries, oldest first.
+
+    Two bounded reads, however long the session's history is.
+    """
+    store = get_chat_store()
+    # Mood entries only carry their minute, so messages are placed by theirs
+    dated = [
+        (time.strftime("%Y-%m-%d %H:%M", time.localtime(m["created_at"])), MemoryItem(m["role"], m["content"], m["seq"]))
+        for m in store.load_messages(session_id, limit=MEMORY_CAPACITY)
+    ] + [(entry["date"], mood_memory(entry)) for entry in store.load_moods(session_id, limit=MEMORY_CAPACITY)]
+    dated.sort(key=lambda pair: pair[0]) # Stable, so each kind keeps its stored order
+    index = VectorIndex(capacity=MEMORY_CAPACITY)
+    for _, item in dated[-MEMORY_CAPACITY:]:
+        index.add(item)
+    return index
+
+def recall_message(query: str, before_seq: int) -> Optional[dict]:
+    """A system message with the memories most relevant to `query`, or None if nothing is close enough.
+
+    Only messages before position `before_seq` (the ones left out of the prompt)
+    and mood entries are recalled.
+    """
+    hits = st.session_state.memory_index.search(query, MEMORY_TOP_K, before_seq=before_seq, min_score=MEMORY_MIN_SCORE)
+    if not hits:
+        return None
+    memories = "\n".join(f"- {MEMORY_LABELS[item.kind]}: {item.text}" for _, item in hits)
+    return {
+        "role": "system",
+        "content": f"Relevant moments from earlier in your conversations with this user:\n{memories}",
+    }
 
 # --- Page Configuration ---
 st.set_page_config(page_icon=PAGE_ICON, layout="wide", page_title=PAGE_TITLE, initial_sidebar_state="expanded")
+startup.mark("page config")
 
 # --- Session State Initialization ---
+if "session_id" not in st.session_state:
+    # Kept in the URL so a refresh resumes the same stored conversation. The ID is the only key to
+    # the transcript, so anything but a generated one (e.g. "1" or "test") starts a new session.
+    sid = st.query_params.get("sid", "")
+    st.session_state.session_id = sid if SESSION_ID.fullmatch(sid) else uuid.uuid4().hex
+    st.query_params["sid"] = st.session_state.session_id
+if "store_revision" not in st.session_state:
+    # Read before anything is loaded, so writes made while loading trigger a resync
+    st.session_state.store_revision = get_chat_store().revision(st.session_state.session_id)
 if "messages" not in st.session_state:
-    st.session_state.messages = [{"role": "system", "content": _get_system_prompt()}]
+    load_session_messages()
 if "selected_model" not in st.session_state:
     st.session_state.selected_model = None # Will be set by sidebar default
 if "chat_counter" not in st.session_state:
     st.session_state.chat_counter = 0
+if "history_visible" not in st.session_state:
+    st.session_state.history_visible = HISTORY_PAGE_SIZE
+if "earlier_messages" not in st.session_state:
+    st.session_state.earlier_messages = {"until": 0, "messages": []} # Pages read back from the store
 if "show_welcome" not in st.session_state:
-    st.session_state.show_welcome = True
+    st.session_state.show_welcome = len(st.session_state.messages) == 1 # Skip it when resuming a stored chat
 if "theme" not in st.session_state:
     st.session_state.theme = "light"
 if "mood_log" not in st.session_state:
-    st.session_state.mood_log = []
+    st.session_state.mood_log = get_chat_store().load_moods(st.session_state.session_id, limit=MOODS_IN_MEMORY)
+if "mood_series" not in st.session_state:
+    # The whole log in columnar form, for the insights panel
+    st.session_state.mood_series = MoodSeries.from_entries(get_chat_store().load_moods(st.session_state.session_id))
 if "audio_played" not in st.session_state:
     st.session_state.audio_played = False
+if "context_window" not in st.session_state:
+    st.session_state.context_window = ContextWindow()
+if "memory_index" not in st.session_state:
+    st.session_state.memory_index = build_memory_index(st.session_state.session_id)
+sync_with_store()
+startup.mark("session state")
 
 # Apply CSS
 load_css(st.session_state.theme)
+startup.mark("css")
 
 # --- Enhanced UI Functions ---
 def icon(emoji: str):
     st.write(f'<span style="font-size: 80px; line-height: 1">{emoji}</span>', unsafe_allow_html=True)
 
 def clear_chat_history():
+    note_own_write(get_chat_store().clear_session(st.session_state.session_id))
     st.session_state.messages = [{"role": "system", "content": _get_system_prompt()}]
+    st.session_state.messages_on_disk_only = 0
+    st.session_state.history_visible = HISTORY_PAGE_SIZE
+    st.session_state.earlier_messages = {"until": 0, "messages": []}
     st.session_state.chat_counter = 0
-    st.session_state.show_welcome = True
+    save_setting("show_welcome", True)
     st.session_state.audio_played = False
     st.session_state.mood_log = [] # Optionally clear mood log too
+    st.session_state.mood_series = MoodSeries()
+    st.session_state.memory_index = VectorIndex(capacity=MEMORY_CAPACITY)
 
 def dismiss_welcome():
-    st.session_state.show_welcome = False
+    save_setting("show_welcome", False)
 
 def use_quick_prompt(prompt):
-    st.session_state.show_welcome = False
+    save_setting("show_welcome", False)
+    st.session_state.quick_prompt = prompt # Lets the response path look for a precomputed answer
     # Add user prompt to messages *before* generating response
-    st.session_state.messages.append({"role": "user", "content": prompt})
+    append_message("user", prompt)
     st.session_state.chat_counter += 1
     # We don't return the prompt here, the main loop will handle it
     # We trigger a rerun to show the user message and then generate response
@@ -273,13 +566,126 @@ models = {
     },
 }
 
+# The sidebar's initial model, and the one quick-prompt answers are precomputed for
+DEFAULT_MODEL = list(models)[DEFAULT_MODEL_INDEX if 0 <= DEFAULT_MODEL_INDEX < len(models) else 0]
+
+# Requests/min and tokens/min per model, shared by every session (Groq's free-tier
+# limits; raise them to match your organization's tier)
+DEFAULT_RATE_LIMITS = RateLimits(requests_per_minute=30, tokens_per_minute=6000)
+MODEL_RATE_LIMITS = {
+    "llama-3.3-70b-versatile": RateLimits(30, 12000),
+    "Llama3-8b-8192": RateLimits(30, 6000),
+    "mistral-saba-24b": RateLimits(30, 6000),
+    "gemma-2-27b-it": RateLimits(30, 15000),
+    "llama-3.2-1b-preview": RateLimits(30, 7000),
+    "meta-llama/llama-4-scout-17b-16e-instruct": RateLimits(30, 30000),
+}
+
+# --- Streaming Renderer ---
+class StreamRenderer:
+    """Renders a stream of text deltas into a placeholder in batches.
+
+    Deltas are buffered in a list and only pushed to the placeholder once
+    `flush_interval` seconds have passed or `flush_chars` characters are waiting,
+    so the number of markdown re-renders no longer grows with every chunk.
+    The placeholder becomes a container: each markdown block is frozen into its
+    own element once complete, and a flush only re-renders the open last block,
+    so its cost follows the new text rather than the whole response.
+    """
+
+    def __init__(self, placeholder, flush_interval: float = STREAM_FLUSH_INTERVAL,
+                 flush_chars: int = STREAM_FLUSH_CHARS, cursor: str = "▌",
+                 started_at: Optional[float] = None):
+        self.placeholder = placeholder
+        self.flush_interval = flush_interval
+        self.flush_chars = flush_chars
+        self.cursor = cursor
+        # Pass started_at from before the API call so TTFT includes request latency
+        self.started_at = time.perf_counter() if started_at is None else started_at
+        self.first_token_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.token_count = 0
+        self._parts = []
+        self._flushed_parts = 0
+        self._pending_chars = 0
+        self._blocks = MarkdownBlocks()
+        self._container = None
+        self._open_slot = None # Element showing the open block
+        self._last_flush = self.started_at
+
+    def write(self, delta: str):
+        now = time.perf_counter()
+        if self.first_token_at is None:
+            self.first_token_at = now
+        self._parts.append(delta)
+        self.token_count += 1
+        self._pending_chars += len(delta)
+        if self._pending_chars >= self.flush_chars or now - self._last_flush >= self.flush_interval:
+            self.flush(now)
+
+    def flush(self, now: Optional[float] = None):
+        if self._flushed_parts == len(self._parts):
+            return
+        self._pending_chars = 0
+        self._last_flush = time.perf_counter() if now is None else now
+        self._render(self.cursor) # Typing effect
+
+    def _render(self, cursor: str):
+        """Feeds the unflushed deltas to the block splitter and updates only what changed."""
+        chunk = "".join(self._parts[self._flushed_parts:])
+        self._flushed_parts = len(self._parts)
+        if self._container is None:
+            self._container = self.placeholder.container()
+        for block in self._blocks.feed(chunk):
+            self._slot().markdown(block) # Complete: never rendered again
+            self._open_slot = None
+        self._slot().markdown(self._blocks.open_block + cursor)
+
+    def _slot(self):
+        if self._open_slot is None:
+            self._open_slot = self._container.empty()
+        return self._open_slot
+
+    def consume(self, deltas) -> str:
+        """Streams every delta from `deltas` and returns the complete text."""
+        for delta in deltas:
+            self.write(delta)
+        return self.finish()
+
+    def finish(self) -> str:
+        """Renders the final text without the cursor and returns it."""
+        self.finished_at = time.perf_counter()
+        self._render("")
+        return "".join(self._parts)
+
+    @property
+    def stats(self) -> Dict[str, Optional[float]]:
+        end = self.finished_at if self.finished_at is not None else time.perf_counter()
+        ttft = None if self.first_token_at is None else self.first_token_at - self.started_at
+        generation_time = None if self.first_token_at is None else end - self.first_token_at
+        tokens_per_sec = None
+        if generation_time:
+            tokens_per_sec = self.token_count / generation_time
+        return {
+            "ttft": ttft,
+            "total_time": end - self.started_at,
+            "tokens": self.token_count,
+            "tokens_per_sec": tokens_per_sec,
+        }
+
 # --- Mood Tracking Feature ---
+@st.fragment
 def log_mood():
-    with st.sidebar.expander("🩺 Chill Tracker", expanded=False):
-        mood = st.selectbox("How are you feeling today?", ["Great", "Good", "Okay", "Low", "Very Low"], key="mood_select")
+    with st.expander("🩺 Chill Tracker", expanded=False):
+        mood = st.selectbox("How are you feeling today?", MOODS[::-1], key="mood_select")
         notes = st.text_area("Any notes? (e.g., sleep, stress)", height=100, key="mood_notes")
         if st.button("Log Mood", key="log_mood_button"):
-            st.session_state.mood_log.append({"date": time.strftime("%Y-%m-%d %H:%M"), "mood": mood, "notes": notes})
+            entry = {"date": time.strftime("%Y-%m-%d %H:%M"), "mood": mood, "notes": notes}
+            note_own_write(get_chat_store().append_mood(st.session_state.session_id, entry))
+            st.session_state.memory_index.add(mood_memory(entry))
+            st.session_state.mood_log.append(entry)
+            del st.session_state.mood_log[:-MOODS_IN_MEMORY]
+            st.session_state.mood_series.append(entry)
             st.success("Mood logged successfully!")
             # Rerun optional, but can clear the fields if desired after logging
             # st.rerun()
@@ -287,6 +693,52 @@ def log_mood():
             st.subheader("Recent Moods")
             for entry in reversed(st.session_state.mood_log[-3:]): # Show newest first
                 st.write(f"{entry['date']}: {entry['mood']} - {entry['notes']}")
+        if len(st.session_state.mood_series) and st.toggle("📊 Show insights", key="mood_insights"):
+            mood_insights(st.session_state.mood_series)
+
+def mood_summary(series: MoodSeries, theme: str) -> dict:
+    """Streaks, rolling average and figures for the insights panel.
+
+    Rebuilt only when entries were appended, the theme changed or a new day began.
+    """
+    today = time.strftime("%Y-%m-%d")
+    key = (series.version, theme, today)
+    cached = st.session_state.get("mood_summary")
+    if cached is not None and cached[0] is series and cached[1] == key:
+        return cached[2]
+    layout = {
+        "template": "plotly_dark" if theme == "dark" else "plotly_white",
+        "height": MOOD_CHART_HEIGHT,
+        "margin": {"l": 0, "r": 0, "t": 30, "b": 0},
+        "legend": {"orientation": "h", "title": None},
+    }
+    import plotly.express as px # Only the insights panel needs plotly (and pandas); keeps it out of cold starts
+
+    daily = daily_scores(series, MOOD_ROLLING_DAYS)
+    trend = px.line(daily, title="Mood over time", labels={"value": "Mood (1-5)", "index": "", "variable": ""})
+    trend.update_traces(connectgaps=True)
+    weekdays = px.bar(weekday_pattern(series), x="Weekday", y="Average", hover_data=["Entries"],
+                      title="By day of the week", range_y=[0, len(MOODS)])
+    distribution = px.bar(mood_counts(series), x="Mood", y="Entries", title="How often")
+    for figure in (trend, weekdays, distribution):
+        figure.update_layout(**layout)
+    summary = {
+        "streaks": streaks(series, np.datetime64(today)),
+        "rolling_average": float(daily.iloc[-1, 1]),
+        "figures": [trend, weekdays, distribution],
+    }
+    st.session_state.mood_summary = (series, key, summary)
+    return summary
+
+def mood_insights(series: MoodSeries):
+    summary = mood_summary(series, st.session_state.theme)
+    current = summary["streaks"]
+    columns = st.columns(2)
+    columns[0].metric("Logging streak", f"{current.current_logging} d", help=f"Longest: {current.longest_logging} days")
+    columns[1].metric("Good days", f"{current.current_good} d", help=f"Longest: {current.longest_good} days")
+    st.caption(f"{MOOD_ROLLING_DAYS}-day average: {summary['rolling_average']:.1f} / {len(MOODS)} over {len(series):,} entries")
+    for figure in summary["figures"]:
+        st.plotly_chart(figure, use_container_width=True, config={"displayModeBar": False})
 
 def display_welcome_message():
     if st.session_state.show_welcome:
@@ -308,15 +760,343 @@ def display_welcome_message():
                     dismiss_welcome()
                     st.rerun()
 
+@st.cache_resource(show_spinner=False)
+def get_groq_client(api_key: str) -> Groq:
+    """One client, and so one pooled HTTP connection, per API key for the whole process."""
+    return Groq(api_key=api_key, max_retries=0) # Retries are handled by ResilientChat
+
+@st.cache_resource(show_spinner=False)
+def get_resilient_chat(api_keys: tuple) -> ResilientChat:
+    """Retry/fallback layer whose circuit breakers and rate-limit queue are shared by every session."""
+    admission = AdmissionController(
+        {model_id: MODEL_RATE_LIMITS.get(model_id, DEFAULT_RATE_LIMITS) for model_id in models},
+        list(api_keys), max_wait=ADMISSION_MAX_WAIT, buckets=create_bucket_store(RATE_LIMIT_STORE_URL),
+    )
+    return ResilientChat(get_groq_client(api_keys[0]), admission=admission,
+                         clients={api_key: get_groq_client(api_key) for api_key in api_keys},
+                         request_cost=estimate_request_tokens)
+
+def queue_position_reporter(placeholder, loading_message: str):
+    """An `on_wait` callback that shows the queue position in place of the loading message."""
+    def report(position: int, eta: float):
+        if position:
+            text = f"⏳ It's busy right now: you're #{position} in line, about {max(1, round(eta))}s to go..."
+        else:
+            text = loading_message
+        placeholder.markdown(f"<div class='progress-message'>{text}</div>", unsafe_allow_html=True)
+    return report
+
+def context_limit(model_id: str) -> int:
+    """Tokens a request to the model may use in total, prompt and reply."""
+    return int(models[model_id]["tokens"] * (1 - CONTEXT_SAFETY_MARGIN))
+
+def max_input_tokens(model_id: str) -> int:
+    """The longest user message the model can take next to the system prompt and a minimal reply."""
+    family = models[model_id]["developer"]
+    system_tokens = message_tokens({"role": "system", "content": _get_system_prompt()}, family)
+    return context_limit(model_id) - prompt_overhead(family) - system_tokens - MIN_REPLY_TOKENS
+
+def shorten_message(message: dict, family: str, token_limit: int) -> dict:
+    """The message cut down to `token_limit` tokens, with a note that it was."""
+    content, shortened = message["content"], message
+    while content and message_tokens(shortened, family) > token_limit:
+        # Scale by the overshoot, a little extra so the loop rarely runs more than twice
+        content = content[:int(len(content) * token_limit / message_tokens(shortened, family) * 0.95)]
+        shortened = {**message, "content": content + TRUNCATION_NOTE}
+    return shortened
+
+def size_request(model_id: str, messages: list, max_tokens: int) -> Tuple[list, int, int]:
+    """Fits history and reply into the model's window: (messages, prompt tokens, max_tokens).
+
+    A history that fits is sent whole. Once turns have to be left out (trimmed
+    here, or only kept in the store), the memories most relevant to the latest
+    message are recalled from them into a system message after the system prompt.
+    """
+    family = models[model_id]["developer"]
+    token_limit = context_limit(model_id)
+    model_max_tokens = min(max_tokens, token_limit) # The slider follows the sidebar model's limit
+    window = st.session_state.context_window
+    fitted, prompt_tokens = window.fit(messages, token_limit, model_max_tokens, family)
+    if len(fitted) < len(messages) or st.session_state.messages_on_disk_only:
+        first_sent_seq = st.session_state.messages_on_disk_only + len(messages) - len(fitted) + 1
+        memory_message = recall_message(messages[-1]["content"], first_sent_seq)
+        if memory_message is not None:
+            # Make room for the memories; turns this drops as well are simply left out
+            memory_tokens = message_tokens(memory_message, family)
+            fitted, prompt_tokens = window.fit(messages, token_limit, model_max_tokens + memory_tokens, family)
+            fitted = fitted[:1] + [memory_message] + fitted[1:]
+            prompt_tokens += memory_tokens
+    if token_limit - prompt_tokens < MIN_REPLY_TOKENS and len(fitted) > 1:
+        # Only the latest message is left and it's too long for this model (e.g. a smaller fallback
+        # or draft model; the chat input refuses messages too long for the selected one): cut it
+        latest_tokens = message_tokens(fitted[-1], family)
+        room = max(0, latest_tokens - (MIN_REPLY_TOKENS - (token_limit - prompt_tokens)))
+        fitted = fitted[:-1] + [shorten_message(fitted[-1], family, room)]
+        prompt_tokens += message_tokens(fitted[-1], family) - latest_tokens
+    # A prompt that still doesn't leave room shrinks the reply instead
+    return fitted, prompt_tokens, max(1, min(model_max_tokens, token_limit - prompt_tokens))
+
+def build_request(model_id: str, messages: list, temperature: float, max_tokens: int) -> dict:
+    """Request arguments for one model, with history and max_tokens sized to its limit."""
+    fitted, _, model_max_tokens = size_request(model_id, messages, max_tokens)
+    return {
+        "messages": fitted,
+        "temperature": temperature,
+        "max_tokens": model_max_tokens,
+        "top_p": 1,
+        "stop": None,
+    }
+
+def estimate_request_tokens(model_id: str, request: dict) -> int:
+    """Tokens a request counts against tokens/min: the prompt plus the most it may generate."""
+    family = models[model_id]["developer"]
+    prompt_tokens = sum(message_tokens(m, family) for m in request["messages"]) + prompt_overhead(family)
+    return prompt_tokens + request["max_tokens"]
+
+@st.cache_resource(show_spinner=False)
+def get_response_cache() -> ResponseCache:
+    """Process-wide cache for quick prompts and repeated first-turn questions."""
+    return ResponseCache(RESPONSE_CACHE_PATH, max_bytes=RESPONSE_CACHE_MAX_BYTES,
+                         disk_max_bytes=RESPONSE_CACHE_DISK_MAX_BYTES, ttl=RESPONSE_CACHE_TTL)
+
+def quick_prompt_target() -> WarmupTarget:
+    """The quick prompts as first turns with the sidebar's default model and settings."""
+    return WarmupTarget(DEFAULT_MODEL, _get_system_prompt(), DEFAULT_TEMPERATURE,
+                        min(DEFAULT_MAX_TOKENS, models[DEFAULT_MODEL]["tokens"]), tuple(QUICK_PROMPTS))
+
+@st.cache_resource(show_spinner=False)
+def get_quick_prompt_warmer(_chat_gateway: ResilientChat) -> PromptWarmer:
+    """Process-wide thread that keeps quick-prompt answers precomputed in the response cache."""
+    def answer(target: WarmupTarget, prompt: str) -> str:
+        request = {"messages": target.messages(prompt), "temperature": target.temperature,
+                   "max_tokens": target.max_tokens, "top_p": 1, "stop": None}
+        # No fallback: another model's answer mustn't be stored under this model's key
+        response_stream = _chat_gateway.stream([target.model], lambda model_id: request, session_id=WARMUP_SESSION_ID)
+        try:
+            return "".join(response_stream)
+        finally:
+            record_stream_errors(response_stream)
+    return PromptWarmer(get_response_cache(), answer, refresh_interval=QUICK_PROMPT_REFRESH_INTERVAL,
+                        retry_interval=QUICK_PROMPT_RETRY_INTERVAL)
+
+def replay_cached_response(response: str, chunk_size: int = 16) -> Generator[str, None, None]:
+    """Yields a cached response in small chunks so it streams like a live one."""
+    for start in range(0, len(response), chunk_size):
+        yield response[start:start + chunk_size]
+
+# --- Static Assets ---
+@st.cache_resource(show_spinner=False)
+def get_image_asset(relative_path: str, width: int) -> Asset:
+    """Optimized image, rendered once per process instead of read from disk on every rerun."""
+    return image_asset(relative_path, width)
+
+@st.cache_resource(show_spinner=False)
+def get_audio_asset(relative_path: str) -> Asset:
+    return audio_asset(relative_path)
+
+def render_image(asset: Asset, caption: str, width: int):
+    # A static URL lets the browser cache the file; otherwise fall back to sending the bytes
+    if asset.url:
+        st.markdown(
+            f"<figure style='margin: 0;'><img src='{asset.url}' width='{width}' alt='{caption}' loading='lazy'>"
+            f"<figcaption style='font-size: 0.875rem; opacity: 0.7;'>{caption}</figcaption></figure>",
+            unsafe_allow_html=True,
+        )
+    else:
+        st.image(asset.data, caption=caption, width=width)
+
+def render_audio(asset: Asset):
+    if asset.url:
+        st.markdown(f"<audio controls preload='none' src='{asset.url}' style='width: 100%;'></audio>", unsafe_allow_html=True)
+    else:
+        st.audio(asset.data, format=asset.mimetype)
+
+# --- Instrumentation ---
+@st.cache_resource(show_spinner=False)
+def start_metrics_exporter():
+    """Starts the /metrics endpoint once per process if METRICS_PORT is set."""
+    if METRICS_PORT:
+        return metrics.start_http_exporter(metrics.registry, int(METRICS_PORT))
+    return None
+
+def record_response_metrics(model_id: str, stats: Dict[str, Optional[float]], cached: bool = False):
+    """Records one streamed response in the process-wide metrics."""
+    if cached:
+        metrics.registry.observe("cached_response_seconds", stats["total_time"], model=model_id)
+        return
+    metrics.registry.observe("groq_ttft_seconds", stats["ttft"], model=model_id)
+    metrics.registry.observe("groq_request_seconds", stats["total_time"], model=model_id)
+    metrics.registry.observe("groq_tokens_per_second", stats["tokens_per_sec"], model=model_id)
+    metrics.registry.increment("groq_output_tokens", stats["tokens"], model=model_id)
+
+def record_stream_errors(response_stream):
+    """Counts the errors, retries and resumes a ResilientStream went through, and its queue wait."""
+    metrics.registry.observe("admission_wait_seconds", response_stream.queued_seconds,
+                             model=response_stream.model or response_stream.candidates[0])
+    for model_id, error in response_stream.errors.items():
+        metrics.registry.increment("groq_errors", model=model_id, error=type(error).__name__)
+    if response_stream.retries:
+        metrics.registry.increment("groq_retries", response_stream.retries)
+    if response_stream.resumed:
+        metrics.registry.increment("groq_resumed_streams", response_stream.resumed)
+
+# --- Model Comparison ---
+def _drain_into_queue(source: str, response_stream: ResilientStream, events: queue.Queue,
+                      stop: Optional[threading.Event] = None):
+    """Worker: queues (source, delta) events, then (source, None) or (source, error); quits once `stop` is set."""
+    try:
+        deltas = iter(response_stream)
+        try:
+            for delta in deltas:
+                if stop is not None and stop.is_set():
+                    break
+                events.put((source, delta))
+        finally:
+            deltas.close() # Drops the HTTP stream of an abandoned response
+            record_stream_errors(response_stream)
+        events.put((source, None))
+    except Exception as e:
+        events.put((source, e))
+
+def _stream_into_queue(chat_gateway: ResilientChat, model_id: str, request_kwargs: dict, session_id: str, events: queue.Queue,
+                       stop: threading.Event):
+    """Worker: queues (model_id, delta) events, then (model_id, None) or (model_id, error)."""
+    # Retried on the same model only: falling back would defeat the comparison
+    response_stream = chat_gateway.stream([model_id], lambda _: request_kwargs, session_id=session_id, stop=stop)
+    _drain_into_queue(model_id, response_stream, events, stop)
+
+def stream_model_comparison(chat_gateway: ResilientChat, model_ids: list, messages: list, temperature: float, max_tokens: int) -> Dict[str, str]:
+    """Streams the same conversation from several models at once, one column each.
+
+    The API streams are read on a bounded thread pool and handed back over a
+    queue, so all rendering stays on the script thread while total wall time
+    tracks the slowest model rather than the sum of them. Returns the complete
+    response of every model that succeeded.
+    """
+    events = queue.Queue()
+    stop = threading.Event() # Set if the script leaves early (e.g. a rerun), so queued workers give up
+    renderers, stats_slots, responses = {}, {}, {}
+    started_at = time.perf_counter()
+    for column, model_id in zip(st.columns(len(model_ids)), model_ids):
+        with column:
+            st.markdown(f"**🤖 {models[model_id]['name']}**")
+            renderers[model_id] = StreamRenderer(st.empty(), started_at=started_at)
+            stats_slots[model_id] = st.empty()
+
+    with ThreadPoolExecutor(max_workers=min(COMPARE_MAX_WORKERS, len(model_ids))) as pool:
+        for model_id in model_ids:
+            request_kwargs = build_request(model_id, messages, temperature, max_tokens)
+            pool.submit(_stream_into_queue, chat_gateway, model_id, request_kwargs, st.session_state.session_id, events,
+                        stop)
+
+        pending = set(model_ids)
+        try:
+            while pending:
+                model_id, event = events.get()
+                renderer = renderers[model_id]
+                if isinstance(event, str):
+                    renderer.write(event)
+                    continue
+                pending.discard(model_id)
+                if isinstance(event, Exception):
+                    renderer.flush()
+                    stats_slots[model_id].error(f"{models[model_id]['name']} failed: {event}", icon="🚨")
+                    continue
+                responses[model_id] = renderer.finish()
+                stats = renderer.stats
+                record_response_metrics(model_id, stats)
+                ttft = "–" if stats["ttft"] is None else f"{stats['ttft']:.2f}s"
+                stats_slots[model_id].caption(
+                    f"⏱️ {stats['total_time']:.2f}s total · ⚡ {ttft} to first token · 🔢 {stats['tokens']} tokens"
+                )
+        finally:
+            stop.set() # No-op once every model answered; otherwise the pool's shutdown doesn't wait on the API
+    return responses
+
+# --- Fast First Response ---
+def stream_with_draft(chat_gateway: ResilientChat, model_id: str, messages: list, temperature: float,
+                      max_tokens: int, renderer: StreamRenderer, loading_message: str) -> Tuple[str, ResilientStream]:
+    """Shows a quick DRAFT_MODEL answer while `model_id` gets going, then replaces it in place.
+
+    Both models are asked at once on worker threads. Draft deltas go to the
+    renderer's placeholder until the selected model's first token arrives; from
+    then on `renderer` shows that answer and the draft is abandoned. Only the
+    final answer is returned, with its stream. How much sooner the draft's
+    first token appeared is recorded as `draft_latency_saved_seconds`.
+    """
+    placeholder = renderer.placeholder
+    draft = StreamRenderer(placeholder, started_at=renderer.started_at)
+    status = st.empty()
+    events = queue.Queue()
+    stop_draft = threading.Event()
+    report_position = queue_position_reporter(placeholder, loading_message)
+
+    # request_for runs on the worker thread, away from session state, so every candidate's request is built here
+    candidates = fallback_order(model_id, list(models))
+    requests = {candidate: build_request(candidate, messages, temperature, max_tokens) for candidate in candidates}
+    response_stream = chat_gateway.stream(
+        candidates, requests.__getitem__, session_id=st.session_state.session_id,
+        on_wait=lambda position, eta: events.put(("final", (position, eta))),
+    )
+    # No fallback for the draft: a slower model's draft wouldn't save anything
+    draft_request = build_request(DRAFT_MODEL, messages, temperature, min(max_tokens, DRAFT_MAX_TOKENS))
+    # stop_draft also keeps a draft that's no longer needed from being admitted or sent at all
+    draft_stream = chat_gateway.stream([DRAFT_MODEL], lambda _: draft_request, session_id=st.session_state.session_id,
+                                       stop=stop_draft)
+    # Daemon threads rather than a pool: an abandoned draft must not hold up the answer
+    threading.Thread(target=_drain_into_queue, args=("final", response_stream, events), daemon=True).start()
+    threading.Thread(target=_drain_into_queue, args=("draft", draft_stream, events, stop_draft), daemon=True).start()
+
+    try:
+        while True:
+            source, event = events.get()
+            if source == "draft":
+                if stop_draft.is_set():
+                    continue
+                if isinstance(event, str):
+                    if draft.first_token_at is None:
+                        status.caption(f"✏️ Quick draft by {models[DRAFT_MODEL]['name']} while "
+                                       f"{models[model_id]['name']} writes the full answer...")
+                    draft.write(event)
+                elif event is None and draft.first_token_at is not None:
+                    draft.finish()
+                continue # A failed draft just leaves the loading message up
+            if isinstance(event, tuple):
+                if draft.first_token_at is None:
+                    report_position(*event)
+                continue
+            if isinstance(event, Exception):
+                raise event
+            if event is None:
+                break
+            if renderer.first_token_at is None:
+                stop_draft.set() # The final answer takes over the placeholder from here
+                status.empty()
+            renderer.write(event)
+    finally:
+        stop_draft.set()
+        status.empty()
+    full_response = renderer.finish()
+
+    saved = 0.0
+    if draft.first_token_at is not None and renderer.first_token_at is not None:
+        saved = max(0.0, renderer.first_token_at - draft.first_token_at)
+    metrics.registry.observe("draft_latency_saved_seconds", saved, model=response_stream.model)
+    return full_response, response_stream
+
 # --- Main App Layout ---
 icon(PAGE_ICON)
 st.markdown(f'<a href="https://vers3dynamics.io/" style="color: {"#BA55D3" if st.session_state.theme == "dark" else "#9370DB"}; text-decoration:none;"><h2>{PAGE_TITLE}</h2></a>', unsafe_allow_html=True)
 st.subheader(f"{APP_NAME}: {APP_TAGLINE}")
+startup.mark("header", first_paint=True)
 
 # Initialize Groq client
 try:
     # Attempt to get API key from Streamlit secrets
-    groq_api_key = st.secrets.get("GROQ_API_KEY")
+    try:
+        groq_api_key = st.secrets.get("GROQ_API_KEY")
+    except FileNotFoundError:
+        groq_api_key = None # No secrets.toml at all
     if not groq_api_key:
         # Fallback to environment variable if not in secrets
         groq_api_key = os.environ.get("GROQ_API_KEY")
@@ -325,14 +1105,23 @@ try:
         st.error("Groq API key not found. Please set it in Streamlit secrets (GROQ_API_KEY) or as an environment variable.")
         st.stop()
 
-    client = Groq(api_key=groq_api_key)
+    # Optional extra keys (comma-separated) to spread load across
+    extra_api_keys = [key.strip() for key in os.environ.get("GROQ_API_KEYS", "").split(",") if key.strip()]
+    chat_gateway = get_resilient_chat(tuple(dict.fromkeys([groq_api_key, *extra_api_keys])))
+    # Starts precomputing on the first run, and again whenever the system prompt or default model changes
+    quick_prompt_warmer = get_quick_prompt_warmer(chat_gateway)
+    quick_prompt_warmer.update(quick_prompt_target())
 
 except Exception as e:
     st.error(f"Error initializing Groq client: {e}")
     st.stop()
+startup.mark("client setup")
 
-# Sidebar Enhancements with Audio
-with st.sidebar:
+# --- Sidebar Fragments ---
+# Each sidebar section is a fragment: changing one of its widgets reruns only
+# that section instead of the whole script (client setup, CSS, chat replay).
+@st.fragment
+def control_center():
     st.markdown(f"<h2 style='color: {'#BA55D3' if st.session_state.theme == 'dark' else '#9370DB'};'>🛠️ Control Center</h2>", unsafe_allow_html=True)
 
     # Theme selector
@@ -341,8 +1130,8 @@ with st.sidebar:
     theme = st.radio("Theme", theme_options, index=current_theme_index, key="theme_radio")
     new_theme = "light" if theme == "🌞 Light" else "dark"
     if st.session_state.theme != new_theme:
-        st.session_state.theme = new_theme
-        st.rerun()
+        save_setting("theme", new_theme)
+        st.rerun() # Whole-app rerun so the new stylesheet is applied everywhere
 
     # Model selection
     model_keys = list(models.keys())
@@ -367,18 +1156,29 @@ with st.sidebar:
     )
     # Update session state if selection changes
     if st.session_state.selected_model != model_option:
-        st.session_state.selected_model = model_option
+        save_setting("selected_model", model_option)
         # No rerun needed here, parameters will be read on next input
 
     # Model info
     model_info = models[st.session_state.selected_model] # Use model from session state
-    st.info(f"**Model:** {model_info['name']}  \n**Tokens:** {model_info['tokens']}  \n**By:** {model_info['developer']}  \n**Best for:** {model_info['description']}")
-
     # Ensure max_tokens slider reflects the selected model's limit
     max_tokens_limit = model_info["tokens"]
     # Provide a reasonable default value, capped by the model's limit
-    default_max_tokens = min(2048, max_tokens_limit)
-    max_tokens = st.slider(
+    default_max_tokens = min(DEFAULT_MAX_TOKENS, max_tokens_limit)
+
+    # Live context usage: what the next request would send, and how much room is left for the reply
+    history_tokens = st.session_state.context_window.total(st.session_state.messages, model_info["developer"])
+    fitted, prompt_tokens, reply_tokens = size_request(
+        st.session_state.selected_model, st.session_state.messages,
+        st.session_state.get("max_tokens_slider", default_max_tokens),
+    )
+    context_note = f"{prompt_tokens:,} / {max_tokens_limit:,} tokens ({prompt_tokens / max_tokens_limit:.0%}), reply up to {reply_tokens:,}"
+    if len(fitted) > 1 and fitted[1]["role"] == "system": # A recalled-memory message follows the system prompt
+        context_note += f" · oldest turns trimmed, recalling from {len(st.session_state.memory_index):,} entries"
+    elif prompt_tokens < history_tokens:
+        context_note += " · oldest turns trimmed"
+    st.info(f"**Model:** {model_info['name']}  \n**Tokens:** {model_info['tokens']}  \n**Context:** {context_note}  \n**By:** {model_info['developer']}  \n**Best for:** {model_info['description']}")
+    st.slider(
         "Max Tokens",
         min_value=512, # Sensible minimum
         max_value=max_tokens_limit,
@@ -386,55 +1186,85 @@ with st.sidebar:
         step=512, # Larger step for bigger ranges
         key="max_tokens_slider"
     )
-    temperature = st.slider(
+    st.slider(
         "Creativity",
         min_value=0.0,
         max_value=1.0,
-        value=0.7, # Default creativity
+        value=DEFAULT_TEMPERATURE,
         step=0.1,
         key="temp_slider"
     )
 
+    # Compare models side by side
+    if st.checkbox("⚖️ Compare models", key="compare_mode"):
+        st.multiselect(
+            "Models to compare",
+            options=model_keys,
+            default=[st.session_state.selected_model],
+            format_func=lambda x: f"🤖 {models[x]['name']}",
+            key="compare_models"
+        )
+
+    # Speculative draft from the small model while the selected one answers
+    st.checkbox(
+        "⚡ Fast first response",
+        key="fast_draft",
+        help=f"Shows a quick draft from {models[DRAFT_MODEL]['name']} until the selected model's answer arrives",
+    )
+
     if st.button("Reset Chat", key="reset_chat_button"):
         clear_chat_history()
-        st.rerun()
+        st.rerun() # The chat area needs redrawing too
 
+@st.fragment
+def audio_player():
     # Audio Player
-    # Ensure the path is correct relative to the script location
     try:
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        audio_filename = "Intro.mp3"
-        audio_path = os.path.join(script_dir, audio_filename)
-
         st.markdown(f"<h3 style='color: {'#BA55D3' if st.session_state.theme == 'dark' else '#9370DB'};'>🔊 Welcome Message</h3>", unsafe_allow_html=True)
         if st.button("▶️ Play Introduction", key="play_audio"):
-            if os.path.exists(audio_path):
-                st.audio(audio_path, format="audio/mp3")
+            try:
+                render_audio(get_audio_asset(INTRO_AUDIO_PATH))
                 st.session_state.audio_played = True
-            else:
-                st.warning(f"Audio file not found at: {audio_path}")
-    except NameError:
-         st.warning("Could not determine script directory for audio file.")
+            except FileNotFoundError:
+                st.warning(f"Audio file not found: {INTRO_AUDIO_PATH}")
     except Exception as e:
         st.error(f"Error setting up audio player: {e}")
 
+# Sidebar Enhancements with Audio
+with st.sidebar:
+    control_center()
+    audio_player()
 
     # Mood tracker
     log_mood()
 
+    # Response cache counters for operators
+    with st.expander("🗄️ Response Cache", expanded=False):
+        cache_stats = get_response_cache().stats
+        st.caption(
+            f"**Hits:** {cache_stats['hits']} ({cache_stats['disk_hits']} from disk)  \n"
+            f"**Misses:** {cache_stats['misses']}  \n"
+            f"**In memory:** {cache_stats['entries']} entries, {cache_stats['bytes'] / 1024:.1f} KB  \n"
+            f"**Quick prompts warmed:** {quick_prompt_warmer.warmed} ({quick_prompt_warmer.failures} failed)"
+        )
+        if quick_prompt_warmer.last_error:
+            st.caption(f"⚠️ **Last warm-up error:** {quick_prompt_warmer.last_error}")
+
     # Quick prompts
     st.markdown(f"<h3 style='color: {'#BA55D3' if st.session_state.theme == 'dark' else '#9370DB'};'>💡 Quick Start</h3>", unsafe_allow_html=True)
-    quick_prompts = [
-        "What are early signs of anxiety I should watch for?",
-        "How can I spot depression early?",
-        "What self-care helps with stress?",
-        "Explain biological factors in mental health",
-        "What are early intervention tips for psychosis?"
-    ]
-    for i, prompt in enumerate(quick_prompts):
+    for i, prompt in enumerate(QUICK_PROMPTS):
         if st.button(prompt, key=f"qp_{i}"):
             use_quick_prompt(prompt)
             st.rerun() # Rerun to process the quick prompt
+startup.mark("sidebar")
+
+# Current Control Center settings (kept in session state by its widgets)
+model_info = models[st.session_state.selected_model]
+max_tokens = st.session_state.max_tokens_slider
+temperature = st.session_state.temp_slider
+compare_mode = st.session_state.compare_mode
+compare_models = st.session_state.get("compare_models", []) if compare_mode else []
+fast_draft = st.session_state.fast_draft and st.session_state.selected_model != DRAFT_MODEL
 
 # --- Main Content Area ---
 
@@ -443,44 +1273,56 @@ if st.session_state.show_welcome:
     display_welcome_message()
 else:
     # Display image only after welcome is dismissed
-    # Check if image file exists before attempting to display
     try:
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        image_full_path = os.path.join(script_dir, IMAGE_PATH)
-        if os.path.exists(image_full_path):
-             st.image(image_full_path, caption=IMAGE_CAPTION, width=300)
-        # else:
-        #     st.warning(f"Image not found at: {image_full_path}") # Optional warning
-    except NameError:
-         st.warning("Could not determine script directory for image file.")
+        render_image(get_image_asset(IMAGE_PATH, IMAGE_WIDTH), IMAGE_CAPTION, IMAGE_WIDTH)
+    except FileNotFoundError:
+        pass # Optional image; the layout works without it
     except Exception as e:
         st.error(f"Error loading image: {e}")
 
 
-    # Display chat messages from history
-    # Skip the system prompt (index 0)
-    for message in st.session_state.messages[1:]:
+    # Display only the newest messages from history, so rerun cost doesn't grow with the chat
+    history = visible_history()
+    hidden_count = st.session_state.messages_on_disk_only + len(st.session_state.messages) - 1 - len(history)
+    if hidden_count > 0:
+        if st.button(f"⬆️ Load earlier messages ({hidden_count} more)", key="load_earlier"):
+            st.session_state.history_visible += HISTORY_PAGE_SIZE
+            st.rerun()
+    for message in history:
         avatar = '🧠' if message["role"] == "assistant" else '🙋'
         with st.chat_message(message["role"], avatar=avatar):
             st.markdown(message["content"])
 
-    # Generator function for streaming responses
-    def generate_chat_responses(chat_completion_stream):
-        """Yields response chunks from the Groq stream."""
-        for chunk in chat_completion_stream:
-            if chunk.choices[0].delta.content:
-                yield chunk.choices[0].delta.content
+    # A quick prompt queued by use_quick_prompt is already in (and rendered from) the history.
+    # Only that flag triggers a reply: an unanswered turn loaded from the store (a reload, or
+    # another tab still streaming its answer) must not be sent again.
+    pending_prompt = st.session_state.pop("quick_prompt", None)
 
     # Handle chat input from user
-    if user_input := st.chat_input("How can I help you today? 👋..."):
-        st.session_state.chat_counter += 1
+    user_input = st.chat_input("How can I help you today? 👋...")
+    if user_input:
+        input_tokens = message_tokens({"role": "user", "content": user_input}, model_info["developer"])
+        input_limit = max_input_tokens(st.session_state.selected_model)
+        if input_tokens > input_limit:
+            # Refused before it's stored or sent: no request to this model could answer it
+            st.error(
+                f"Your message is about {input_tokens:,} tokens, more than {model_info['name']} can read at once "
+                f"({input_limit:,}). Please shorten it, or choose a model with a larger context window."
+            )
+            user_input = None
+    if user_input or pending_prompt:
+        if user_input:
+            st.session_state.chat_counter += 1
 
-        # Append user message to history *before* displaying it
-        st.session_state.messages.append({"role": "user", "content": user_input})
+            # Append user message to history *before* displaying it
+            append_message("user", user_input)
 
-        # Display user message immediately
-        with st.chat_message("user", avatar='🙋'):
-            st.markdown(user_input)
+            # Display user message immediately
+            with st.chat_message("user", avatar='🙋'):
+                st.markdown(user_input)
+        else:
+            user_input = pending_prompt
+        quick_prompt = user_input == pending_prompt
 
         # Generate and display assistant response
         with st.chat_message("assistant", avatar="🧠"):
@@ -494,32 +1336,81 @@ else:
                 full_response = f"Ah, pier 59... A whisper on the wind. Here is something meant for you:\n\n{POEM}"
                 placeholder.markdown(full_response)
                 # Append hardcoded response to history
-                st.session_state.messages.append({"role": "assistant", "content": full_response})
+                append_message("assistant", full_response)
+
+            elif compare_mode and len(compare_models) > 1:
+                # --- Side-by-side Model Comparison ---
+                placeholder.empty()
+                responses = stream_model_comparison(chat_gateway, compare_models, st.session_state.messages, temperature, max_tokens)
+                # Only one answer continues the conversation: the sidebar model's, if it was compared
+                kept_model = next((m for m in [st.session_state.selected_model, *compare_models] if m in responses), None)
+                if kept_model:
+                    append_message("assistant", responses[kept_model])
+                else:
+                    error_message = "Sorry, I encountered an issue processing your request. Please check the connection or try again later."
+                    append_message("assistant", error_message)
 
             else:
                 # --- Normal API Response Generation ---
                 try:
-                    # Create the API call using sidebar parameters and history
-                    chat_completion_stream = client.chat.completions.create(
-                        model=st.session_state.selected_model, # Model from sidebar state
-                        messages=st.session_state.messages,    # Full conversation history
-                        temperature=temperature,               # Temperature from slider
-                        max_tokens=max_tokens,                 # Max tokens from slider
-                        top_p=1,                               # Standard parameter
-                        stream=True,                           # Enable streaming
-                        stop=None                              # No specific stop sequences
-                    )
-
-                    # Stream the response to the placeholder
-                    for chunk in generate_chat_responses(chat_completion_stream):
-                        full_response += chunk
-                        placeholder.markdown(full_response + "▌") # Typing effect
-
-                    # Display the final response without the cursor
-                    placeholder.markdown(full_response)
+                    request_started_at = time.perf_counter()
+                    selected_model = st.session_state.selected_model
+                    # Trim the oldest turns so the prompt plus max_tokens fits the model
+                    request_messages = build_request(selected_model, st.session_state.messages, temperature, max_tokens)["messages"]
+                    # A quick prompt that opens the chat with the warmed settings gets the precomputed
+                    # answer, and other first-turn questions are looked up in the response cache. Later
+                    # in the chat an answer must see the history, so nothing is replayed.
+                    response_cache = get_response_cache()
+                    first_turn = len(st.session_state.messages) == 2
+                    warm_target = quick_prompt_warmer.target
+                    cache_key = None
+                    warm_key = None
+                    cached_response = None
+                    if quick_prompt and first_turn and (selected_model, temperature, max_tokens) == (
+                        warm_target.model, warm_target.temperature, warm_target.max_tokens
+                    ):
+                        warm_key = warm_target.key(user_input)
+                        cached_response = response_cache.get(warm_key)
+                    if cached_response is None and first_turn:
+                        cache_key = response_cache_key(selected_model, request_messages, temperature, max_tokens)
+                        if cache_key != warm_key: # With the default settings they're the same entry
+                            cached_response = response_cache.get(cache_key)
+
+                    # Stream the response to the placeholder in batched flushes;
+                    # the final response is rendered without the cursor
+                    renderer = StreamRenderer(placeholder, started_at=request_started_at)
+                    answered_by = selected_model
+                    if cached_response is not None:
+                        full_response = renderer.consume(replay_cached_response(cached_response))
+                    else:
+                        if fast_draft and chat_gateway.is_healthy(DRAFT_MODEL):
+                            # Small-model draft first; only the selected model's answer is kept
+                            full_response, response_stream = stream_with_draft(
+                                chat_gateway, selected_model, st.session_state.messages, temperature, max_tokens,
+                                renderer, loading_message,
+                            )
+                        else:
+                            # Retries with backoff, then falls back to the next healthy model in `models`
+                            response_stream = chat_gateway.stream(
+                                fallback_order(selected_model, list(models)),
+                                lambda model_id: build_request(model_id, st.session_state.messages, temperature, max_tokens),
+                                session_id=st.session_state.session_id,
+                                on_wait=queue_position_reporter(placeholder, loading_message),
+                            )
+                            try:
+                                full_response = renderer.consume(response_stream)
+                            finally:
+                                record_stream_errors(response_stream)
+                        answered_by = response_stream.model
+                        if answered_by != selected_model:
+                            metrics.registry.increment("groq_fallbacks", model=selected_model)
+                            st.caption(f"↪️ {models[selected_model]['name']} was unavailable, so {models[answered_by]['name']} answered.")
+                        elif cache_key and full_response:
+                            response_cache.put(cache_key, full_response)
+                    record_response_metrics(answered_by, renderer.stats, cached=cached_response is not None)
 
                     # Append the *complete* assistant response to history AFTER generation
-                    st.session_state.messages.append({"role": "assistant", "content": full_response})
+                    append_message("assistant", full_response)
 
 
                 except Exception as e:
@@ -527,7 +1418,9 @@ else:
                     error_message = "Sorry, I encountered an issue processing your request. Please check the connection or try again later."
                     placeholder.markdown(error_message)
                     # Append error message to history so it's visible
-                    st.session_state.messages.append({"role": "assistant", "content": error_message})
+                    append_message("assistant", error_message)
+
+startup.mark("main content")
 
 # Footer
 footer_color = '#ffffff' if st.session_state.theme == 'dark' else '#000000'
@@ -544,3 +1437,18 @@ st.markdown(
     """,
     unsafe_allow_html=True
 )
+
+# --- Instrumentation ---
+start_metrics_exporter()
+cache_stats = get_response_cache().stats
+for stat in ("hits", "disk_hits", "misses", "entries", "bytes"):
+    metrics.registry.set_gauge(f"response_cache_{stat}", cache_stats[stat])
+metrics.registry.set_gauge("quick_prompt_warmups", quick_prompt_warmer.warmed)
+metrics.registry.set_gauge("quick_prompt_warmup_failures", quick_prompt_warmer.failures)
+for model_id in models:
+    metrics.registry.set_gauge("admission_queue_length", chat_gateway.admission.queue_length(model_id), model=model_id)
+metrics.registry.observe("script_run_seconds", time.perf_counter() - script_started_at)
+if METRICS_FILE:
+    metrics.write_openmetrics_file(metrics.registry, METRICS_FILE, min_interval=METRICS_FILE_INTERVAL)
+startup.mark("footer and metrics")
+startup.finish()
@@ -0,0 +1,70 @@
+"""Offline token counts for the model families in the app's model registry.
+
+The estimator splits text into pieces the way byte-level BPE pre-tokenizers do
+(words with their leading space, digit runs, punctuation runs, whitespace) and
+prices each piece with per-family numbers: Llama 3 merges up to three digits
+and keeps most English words whole, while Mistral's and Gemma's SentencePiece
+vocabularies split digits one by one. Counts are memoized per message text, so
+re-counting a growing transcript only tokenizes the new messages.
+"""
+import re
+from functools import lru_cache
+from typing import Dict, NamedTuple
+
+# Words (with their leading space), digit runs, punctuation runs and whitespace runs
+_PIECES = re.compile(r"'(?:[sdmt]|ll|ve|re)| ?[^\W\d_]+| ?\d+| ?[^\s\w]+|\s+", re.IGNORECASE)
+
+
+class TokenizerProfile(NamedTuple):
+    whole_word_chars: int # ASCII words up to this length are usually a single token
+    chars_per_subword: float # ...longer ones split into pieces of about this many characters
+    digits_per_token: int
+    chars_per_punctuation_token: float
+    chars_per_non_ascii_token: float # Accented, CJK and emoji text
+    message_overhead: int # Role markers and turn delimiters per message
+    prompt_overhead: int # Begin-of-text and the assistant header that primes the reply
+
+
+PROFILES: Dict[str, TokenizerProfile] = {
+    # Llama 3/4: tiktoken-style BPE with a 128k+ vocabulary
+    "Meta": TokenizerProfile(8, 4.0, 3, 2.0, 1.0, 5, 5),
+    # Mistral/Mixtral: SentencePiece with a 32k vocabulary ([INST] ... [/INST])
+    "Mistral": TokenizerProfile(7, 3.5, 1, 1.5, 0.8, 4, 1),
+    # Gemma: SentencePiece with a 256k vocabulary (<start_of_turn> ... <end_of_turn>)
+    "Google": TokenizerProfile(9, 4.5, 1, 1.5, 1.5, 5, 4),
+}
+DEFAULT_FAMILY = "Meta"
+
+
+def profile(family: str) -> TokenizerProfile:
+    return PROFILES.get(family, PROFILES[DEFAULT_FAMILY])
+
+
+@lru_cache(maxsize=8192)
+def count_tokens(text: str, family: str = DEFAULT_FAMILY) -> int:
+    """Estimated number of tokens `text` encodes to for `family`."""
+    p = profile(family)
+    tokens = 0
+    for piece in _PIECES.findall(text):
+        word = piece.lstrip(" ")
+        if not word:
+            tokens += 1 # Run of spaces
+        elif word.isspace():
+            tokens += -(-len(word) // 4) # Newline runs merge a few at a time
+        elif word.isdigit():
+            tokens += -(-len(word) // p.digits_per_token)
+        elif word.isascii() and word.isalpha():
+            tokens += 1 if len(word) <= p.whole_word_chars else -int(-len(word) // p.chars_per_subword)
+        elif word.isascii():
+            tokens += -int(-len(word) // p.chars_per_punctuation_token)
+        else:
+            tokens += max(1, round(len(word) / p.chars_per_non_ascii_token))
+    return tokens
+
+
+def message_tokens(message: Dict[str, str], family: str = DEFAULT_FAMILY) -> int:
+    return count_tokens(message["content"], family) + profile(family).message_overhead
+
+
+def prompt_overhead(family: str = DEFAULT_FAMILY) -> int:
+    return profile(family).prompt_overhead